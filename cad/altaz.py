@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import sun
+import catalogue
+import geometry
+
+#
+#   Where the catalogue stars are, seen from a place at given times.
+#
+#   Works on every star x time in one pass : the stars are precessed
+#   to each time, then the local sidereal time gives the hour angles.
+#   Altitude and azimuth are geometric (no refraction), as the plate's
+#   almucantars are. The plate position uses the same stereographic
+#   projection as r_dec() : the meridian is the x axis with the zenith
+#   towards +x, and east is +y. Arrays are shaped (times, stars).
+
+def sidereal(t, lon=0.0):
+    # local mean sidereal time (degrees) at datetime64 t, longitude east
+    d = sun.days(t)
+    return (280.46061837 + (360.98564736629 * d) + lon) % 360.0
+
+def observe(t, lat, lon=0.0, cat=None, req=1.0):
+    # alt, az (degrees, az from north through east) and plate x, y for
+    # an equator of radius req, of every star in cat at each time in t
+    if cat is None:
+        cat = catalogue.load()
+    t = np.atleast_1d(np.asarray(t, dtype="M8[s]"))
+    ra, dec = catalogue.precess(cat, catalogue.epoch + (sun.days(t) / 365.25))
+
+    ha = np.radians(sidereal(t, lon))[:, None] - ra
+    phi = np.radians(lat)
+    sin_alt = (np.sin(phi) * np.sin(dec)) + (np.cos(phi) * np.cos(dec) * np.cos(ha))
+    alt = np.arcsin(np.clip(sin_alt, -1.0, 1.0))
+    az = np.arctan2(-np.cos(dec) * np.sin(ha), (np.cos(phi) * np.sin(dec)) - (np.sin(phi) * np.cos(dec) * np.cos(ha)))
+
+    r = geometry.r_dec(req, np.degrees(dec))
+    return np.degrees(alt), np.degrees(az) % 360.0, r * np.cos(ha), -r * np.sin(ha)
+
+def table(t, lat, lon=0.0, cat=None, req=1.0):
+    # columns, flattened time major ; time and name repeat for each row
+    if cat is None:
+        cat = catalogue.load()
+    t = np.atleast_1d(np.asarray(t, dtype="M8[s]"))
+    alt, az, x, y = observe(t, lat, lon, cat, req)
+    return {
+        'time' : np.repeat(t, len(cat)),
+        'name' : np.tile(np.asarray(cat['name']), len(t)),
+        'alt' : alt.ravel().astype(np.float32),
+        'az' : az.ravel().astype(np.float32),
+        'x' : x.ravel().astype(np.float32),
+        'y' : y.ravel().astype(np.float32),
+    }
+
+def write(path, cols):
+    # .npz : one array per column, else CSV
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **cols)
+        return
+    t = np.datetime_as_string(cols['time'], unit="s").tolist()
+    names = [ name.decode() for name in cols['name'] ]
+    nums = [ cols[name].astype(float).tolist() for name in [ 'alt', 'az', 'x', 'y' ] ]
+    values = [ v for row in zip(t, names, *nums) for v in row ]
+    with open(path, "w") as f:
+        print("time,name,alt,az,x,y", file=f)
+        f.write(("%s,%s,%.4f,%.4f,%.3f,%.3f\n" * len(t)) % tuple(values))
+
+def parse_times(text):
+    # comma separated ISO times, or @file with one per line
+    if text.startswith("@"):
+        with open(text[1:]) as f:
+            items = [ line.strip() for line in f ]
+    else:
+        items = text.split(",")
+    return np.array([ item for item in items if item ], dtype="M8[s]")
+
+# FIN
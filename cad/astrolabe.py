@@ -1,15 +1,17 @@
 #!/usr/bin/env python
 
 import sys
+import os
 import math
+import array
 import argparse
-import subprocess
 
-from lasercut.laser.laser import Arc, Circle, Polygon, Collection, Config, Text
-from lasercut.laser.laser import radians, degrees
-from lasercut.laser.render import DXF, GCODE, SCAD, PDF
+from math import radians, degrees
+
+#   numpy, lasercut and geometry, like the renderers, process pool, cache
+#   and post-processing, are only imported where they are used, to keep
+#   startup quick for --help and for modules that only want the equations.
 
-#
 #
 #   http://solarsystem.nasa.gov/planets/earth/facts
 
@@ -17,11 +19,15 @@ axial_tilt = 23.4393 # degrees
 eccentricity = 0.01671123
 longitude_of_perihelion = 283.067 # degrees
 
+# altitude of the sun at the end of each twilight
 class Twilight:
     civil = -6
     nautical = -12
     astronomical = -18
 
+#
+#
+
 zodiac = [ 
     "Aries", "Taurus", "Gemini",
     "Cancer", "Leo", "Virgo",
@@ -107,35 +113,22 @@ def intersect(x0, r0, x1, r1):
 
 #
 #   Intersection of 2 circles
+#
+#   Solves with circle 2 rotated onto the y==0 axis,
+#   then rotates the points back into place.
 
 def intersect2(xy1, r1, xy2, r2):
     x1, y1 = xy1
     x2, y2 = xy2
     dx, dy = (x2 - x1), (y2 - y1)
-    angle = math.atan2(dy, dx)
     dc = math.sqrt((dx * dx) + (dy * dy))
 
-    c1 = Circle((x1, y1), r1)
-    c2 = Circle((x2, y2), r2)
-    p = Collection()
-    p.add(c1)
-    p.add(c2)
-    # translate/rotate so circles lie on y==0 axis
-    p.translate(-x1, -y1)
-    p.rotate(-degrees(angle))
-
-    inter = intersect(c1.x, c1.radius, c2.x, c2.radius)
+    inter = intersect(0, r1, dc, r2)
     if inter is None: # no intersection
         return None
 
-    (xi, yi), (xii, yii) = inter
-    p = Polygon()
-    p.add(xi, yi)
-    p.add(xii, yii)
-    # reverse the translate/rotate to restore the y axis component
-    p.rotate(degrees(angle))
-    p.translate(x1, y1)
-    return p.points
+    c, s = dx / dc, dy / dc
+    return [ (x1 + (x * c) - (y * s), y1 + (x * s) + (y * c)) for x, y in inter ]
 
 #
 #
@@ -147,6 +140,7 @@ class Circ:
         self.r = r
 
     def shape(self, s=1.0, **kwargs):
+        from lasercut.laser.laser import Circle
         return Circle((self.x * s, 0), self.r * s, **kwargs)
 
     def intersect(self, c):
@@ -155,82 +149,123 @@ class Circ:
 #
 #
 
-def ticks(work, xy, r1, r2, a1, a2, step, colour=None):
-    x0, y0 = xy
-    a = a1
-    assert a1 <= a2
-    while a <= a2:
-        p = Polygon(colour=colour)
-        x = math.sin(radians(a))
-        y = math.cos(radians(a))
-        p.add(x0 + (r1 * x), y0 + (r1 * y))
-        p.add(x0 + (r2 * x), y0 + (r2 * y))
-        work.add(p)
-        a += step
+#   Ring of radial ticks, held as one array of end points.
+#
+#   The angles come from one arange() so there is no float error to
+#   accumulate, and all the end points are worked out in one pass.
+#   The ring is one object in a part (and one array in its Store),
+#   but the renderers only draw polygons, so each tick is still drawn
+#   as its own 2 point polygon. Drawing a ring as one entity (a DXF
+#   LWPOLYLINE set, one GCODE block or one PDF path) is still to do :
+#   it needs lasercut to have a call that draws disjoint lines.
+
+class TickRing:
+
+    def __init__(self, xy, r1, r2, a1, a2, step, colour=None):
+        import numpy as np
+        assert a1 <= a2
+        self.colour = colour
+        n = int(math.floor(((a2 - a1) / step) + 1e-9)) + 1
+        if (a2 - a1) >= (360 - 1e-9):
+            # don't draw the same tick at both ends of a full circle
+            n = min(n, int(math.ceil((360.0 / step) - 1e-9)))
+        a = np.radians(a1 + (step * np.arange(n)))
+        x, y = np.sin(a), np.cos(a)
+        x0, y0 = xy
+        self.ends = np.stack([
+            np.column_stack([ x0 + (r1 * x), y0 + (r1 * y) ]),
+            np.column_stack([ x0 + (r2 * x), y0 + (r2 * y) ]),
+        ], axis=1)
+
+    @classmethod
+    def from_ends(cls, ends, colour=None):
+        ring = cls.__new__(cls)
+        ring.colour = colour
+        ring.ends = ends
+        return ring
+
+    def __len__(self):
+        return len(self.ends)
+
+    def reverse(self):
+        # last tick first, each drawn from the other end
+        self.ends = self.ends[::-1, ::-1].copy()
+
+    def serpentine(self):
+        # draw every other tick inwards, so the laser doesn't travel back
+        self.ends[1::2] = self.ends[1::2, ::-1].copy()
+
+    def translate(self, dx, dy):
+        self.ends += (dx, dy)
+
+    def travel(self):
+        # moves between the ticks
+        import numpy as np
+        return float(np.hypot(*(self.ends[1:, 0] - self.ends[:-1, 1]).T).sum())
+
+    def lines(self):
+        return [ (tuple(p0), tuple(p1)) for p0, p1 in self.ends.tolist() ]
+
+    def draw(self, drawing, colour):
+        colour = self.colour or colour
+        for p0, p1 in self.lines():
+            drawing.polygon(points=[ p0, p1 ], color=colour)
+
+def ticks(xy, r1, r2, a1, a2, step, colour=None):
+    yield TickRing(xy, r1, r2, a1, a2, step, colour=colour)
 
 #
 #
 
-def draw_almucantar(a, config, colour, work, rad_equator, outer):
-    ra, ya = almucantar(a, rad_equator, config.latitude)
-    circ = Circ(ya, ra)
-    ii = outer.intersect(circ)
-    if ii:
-        (x0, y0), (x1, y1) = ii
-        m = circ.x
-
-        x = x0 - m
-        y = y0
-
-        a = degrees(math.atan2(y, x))
-        x = x1 - m
-        y = y1
-
-        b = degrees(math.atan2(y, x))
-
-        arc = Arc((m, 0), ra, a, b, colour=colour)
-        work.add(arc)
-    else:
-        c = circ.shape(colour=colour)
-        c.rotate(radians(90.0))
-        work.add(c)
+def draw_almucantars(alts, colours, config, rad_equator):
+    # all the almucantars in one pass, clipped by the tropic of capricorn
+    from lasercut.laser.laser import Arc
+    import geometry
+    rad_capricorn = config.size
+    ra, ya, a, b, clipped = geometry.almucantar_arcs(alts, rad_equator, config.latitude, rad_capricorn)
+    rows = zip(ra.tolist(), ya.tolist(), a.tolist(), b.tolist(), clipped.tolist())
+    for (r, m, a, b, clip), colour in zip(rows, colours):
+        if clip:
+            arc = Arc((m, 0), r, a, b, colour=colour)
+            yield arc
+        else:
+            c = Circ(m, r).shape(colour=colour)
+            c.rotate(radians(90.0))
+            yield c
 
 #
 #   Plate basic shape
 
 def cut_plate(config):
+    from lasercut.laser.laser import Arc, Polygon
     size = config.size
     key_angle = 1.0
     key_size = size * 0.98
-    work = Collection(colour=config.cut())
+    colour = config.cut()
     a1 = 180.0 - key_angle
     a2 = 180.0 + key_angle
  
     # leave space for the locator key
-    c = Arc((0, 0), size, a2, a1)
-    work.add(c)
+    c = Arc((0, 0), size, a2, a1, colour=colour)
+    yield c
     # top of the locator key
-    c = Arc((0, 0), key_size, a1, a2)
-    work.add(c)
+    c = Arc((0, 0), key_size, a1, a2, colour=colour)
+    yield c
 
     def spoke(angle):
         angle = radians(angle)
-        p = Polygon()
+        p = Polygon(colour=colour)
         p.add(size * math.cos(angle), size * math.sin(angle))
         p.add(key_size * math.cos(angle), key_size * math.sin(angle))
-        work.add(p)
+        return p
 
-    spoke(a1)
-    spoke(a2)
-
-    return work
+    yield spoke(a1)
+    yield spoke(a2)
 
 
 #
 #   Plate detail
 
-from lasercut.laser.ops import arc_to_poly
-
 def circle_intersection(r1, r2, d):
     # https://mathworld.wolfram.com/Circle-CircleIntersection.html
     # assumes both on the x-axis (ie centre y is 0)
@@ -238,149 +273,336 @@ def circle_intersection(r1, r2, d):
     y = math.sqrt((r2*r2) - (x*x))
     return x, y
 
-class Points:
+#
+#   Filled region bounded by a closed loop of arcs.
+#
+#   Each arc is (x, y, r, a1, a2), anticlockwise from a1 to a2 degrees,
+#   ending where the next one starts. The arcs are only turned into
+#   points when the region is drawn, with enough of them that no edge
+#   is more than tol from its arc.
+
+class Region:
+
+    def __init__(self, arcs, fill, tol=0.05):
+        self.arcs = arcs
+        self.fill = fill
+        self.tol = tol
+
+    def translate(self, dx, dy):
+        self.arcs = [ (x + dx, y + dy, r, a1, a2) for x, y, r, a1, a2 in self.arcs ]
+
+    def points(self):
+        loop = []
+        import numpy as np
+        import geometry
+        for x, y, r, a1, a2 in self.arcs:
+            n = max(2, int(geometry.arc_steps(r, a2 - a1, self.tol)))
+            a = np.radians(np.linspace(a1, a2, n + 1)[:-1])
+            loop.append(np.column_stack([ x + (r * np.cos(a)), y + (r * np.sin(a)) ]))
+        return np.concatenate(loop)
 
-    def __init__(self, *args, **kwargs):
-        self.points = []
-        self.kwargs = kwargs
+    def draw(self, drawing, color):
+        points = [ tuple(p) for p in self.points().tolist() ]
+        drawing.polygon(points=points, color=self.fill, fill=self.fill)
 
-    def add(self, p):
-        self.points.append(p)
+#
+#   Text, as a small record of its rotations and translations.
+#   They are replayed on a lasercut Text only when it is drawn.
+
+class Label:
+
+    __slots__ = ( 'xy', 'text', 'height', 'adjust', 'colour', 'ops', )
+
+    def __init__(self, xy, text, height=None, adjust=None, colour=None, ops=()):
+        self.xy = tuple(xy)
+        self.text = text
+        self.height = height
+        self.adjust = adjust
+        self.colour = colour
+        self.ops = ops
+
+    def rotate(self, angle):
+        self.ops += (( angle, ), )
+
+    def translate(self, dx, dy):
+        self.ops += (( dx, dy, ), )
+
+    def position(self):
+        # where the text ends up, taking rotations as about the origin
+        x, y = self.xy
+        for op in self.ops:
+            if len(op) == 1:
+                a = math.radians(op[0])
+                x, y = (x * math.cos(a)) - (y * math.sin(a)), (x * math.sin(a)) + (y * math.cos(a))
+            else:
+                x, y = x + op[0], y + op[1]
+        return x, y
+
+    @property
+    def x(self):
+        return self.position()[0]
+
+    @property
+    def y(self):
+        return self.position()[1]
+
+    def make(self):
+        from lasercut.laser.laser import Text
+        kwargs = { 'colour' : self.colour, }
+        if self.height is not None:
+            kwargs['height'] = self.height
+        if self.adjust is not None:
+            kwargs['adjust'] = self.adjust
+        t = Text(self.xy, self.text, **kwargs)
+        for op in self.ops:
+            if len(op) == 1:
+                t.rotate(op[0])
+            else:
+                t.translate(*op)
+        return t
+
+    def draw(self, drawing, colour):
+        self.make().draw(drawing, colour)
 
-    def draw(self, drawing, color):
-        fill = self.kwargs.get("fill")
-        if fill:
-            drawing.polygon(points=self.points, color=fill, fill=fill)
+#
+#   Compact store of the primitives of a part.
+#
+#   Primitives are packed into columnar arrays as they are generated :
+#   2 point lines, arcs and circles, and text records, with the colours
+#   interned. Tick rings keep the array of their ends. Anything else
+#   (eg. filled regions) is kept as it is. The lasercut objects are only
+#   made again one at a time, as they are drawn. Fills go first, so the
+#   lines are drawn on top of them.
+
+class Store:
+
+    def __init__(self, items=()):
+        import numpy as np
+        from lasercut.laser.laser import Arc, Circle, Polygon
+
+        if isinstance(items, Store):
+            items = items.items()
+        self.colours, ids = [], {}
+        def colour_id(colour):
+            key = tuple(colour) if isinstance(colour, list) else colour
+            if not key in ids:
+                ids[key] = len(self.colours)
+                self.colours.append(colour)
+            return ids[key]
+
+        # numbers go straight into typed arrays, not lists of floats
+        segs, seg_colour = array.array('d'), array.array('i')
+        self.rings, ring_colour = [], array.array('i')
+        arcs, arc_colour, arc_fill = array.array('d'), array.array('i'), array.array('i')
+        text_xy, text_height, text_colour = array.array('d'), array.array('d'), array.array('i')
+        self.text, self.text_adjust, self.text_ops = [], [], []
+        self.other = []
+        for item in items:
+            fill = getattr(item, "fill", None)
+            if isinstance(item, TickRing):
+                self.rings.append(item.ends)
+                ring_colour.append(colour_id(item.colour))
+            elif isinstance(item, Label):
+                text_xy.extend(item.xy)
+                text_height.append(np.nan if item.height is None else item.height)
+                text_colour.append(colour_id(item.colour))
+                self.text.append(item.text)
+                self.text_adjust.append(item.adjust)
+                self.text_ops.append(item.ops)
+            elif isinstance(item, Arc) and not fill:
+                arcs.extend((item.x, item.y, item.radius, item.start_angle, item.end_angle))
+                arc_colour.append(colour_id(item.colour))
+                arc_fill.append(-1)
+            elif isinstance(item, Circle) and not isinstance(item, Arc):
+                arcs.extend((item.x, item.y, item.radius, np.nan, np.nan))
+                arc_colour.append(colour_id(item.colour))
+                arc_fill.append(-1 if fill is None else colour_id(fill))
+            elif (type(item) is Polygon) and (len(item.points) == 2) and not fill:
+                segs.extend(tuple(item.points[0]) + tuple(item.points[1]))
+                seg_colour.append(colour_id(item.colour))
+            else:
+                self.other.append(item)
+
+        # each column copied once, to an array of just its size
+        def column(values, dtype, width=1):
+            a = np.array(values, dtype=dtype)
+            if width > 1:
+                a.shape = (-1, width)
+            return a
+
+        # circles have nan angles, fills are -1 for none
+        self.segs = column(segs, float, 4)
+        self.seg_colour = column(seg_colour, np.int32)
+        self.ring_colour = column(ring_colour, np.int32)
+        self.arcs = column(arcs, float, 5)
+        self.arc_colour = column(arc_colour, np.int32)
+        self.arc_fill = column(arc_fill, np.int32)
+        self.text_xy = column(text_xy, float, 2)
+        self.text_height = column(text_height, float)
+        self.text_colour = column(text_colour, np.int32)
+
+    def counts(self):
+        import numpy as np
+        counts = {
+            'Segment' : len(self.segs),
+            'TickRing' : len(self.rings),
+            'Arc' : int(np.count_nonzero(~np.isnan(self.arcs[:, 3]))),
+            'Circle' : int(np.count_nonzero(np.isnan(self.arcs[:, 3]))),
+            'Text' : len(self.text),
+        }
+        for item in self.other:
+            name = type(item).__name__
+            counts[name] = counts.get(name, 0) + 1
+        return { k : v for k, v in counts.items() if v }
+
+    def __len__(self):
+        return sum(self.counts().values())
+
+    def translate(self, dx, dy):
+        self.segs[:, 0::2] += dx
+        self.segs[:, 1::2] += dy
+        for ends in self.rings:
+            ends += (dx, dy)
+        self.arcs[:, 0] += dx
+        self.arcs[:, 1] += dy
+        self.text_ops = [ ops + (( dx, dy, ), ) for ops in self.text_ops ]
+        for item in self.other:
+            item.translate(dx, dy)
+
+    def items(self):
+        # the primitives, made one at a time
+        import numpy as np
+        from lasercut.laser.laser import Arc, Circle, Polygon
+        colours = self.colours
+        yield from self.other
+
+        # filled circles before the lines
+        for idx in np.argsort(self.arc_fill < 0, kind='stable').tolist():
+            x, y, r, a1, a2 = self.arcs[idx].tolist()
+            colour = colours[self.arc_colour[idx]]
+            if math.isnan(a1):
+                fill = self.arc_fill[idx]
+                yield Circle((x, y), r, colour=colour, fill=None if fill < 0 else colours[fill])
+            else:
+                yield Arc((x, y), r, a1, a2, colour=colour)
+
+        for idx in range(len(self.segs)):
+            p = Polygon(colour=colours[self.seg_colour[idx]])
+            x0, y0, x1, y1 = self.segs[idx].tolist()
+            p.add(x0, y0)
+            p.add(x1, y1)
+            yield p
+
+        for ends, colour in zip(self.rings, self.ring_colour.tolist()):
+            yield TickRing.from_ends(ends.copy(), colours[colour])
+
+        for idx, text in enumerate(self.text):
+            h = self.text_height[idx]
+            yield Label(tuple(self.text_xy[idx].tolist()), text,
+                height=None if np.isnan(h) else float(h), adjust=self.text_adjust[idx],
+                colour=colours[self.text_colour[idx]], ops=self.text_ops[idx])
+
+    def draw(self, drawing, colour):
+        for item in self.items():
+            item.draw(drawing, colour)
 
 #
 #
 
-def fill_plate(work, config):
+def fill_plate(config):
     # background colour
+    from lasercut.laser.laser import Circle, Config
     rad_capricorn = config.size
     rad_equator = r_eq(rad_capricorn)
 
-    capricorn = Circle((0, 0), rad_capricorn)
-
     r, x = almucantar(0, rad_equator, config.latitude)
-    horizon = Circle((x, 0), r)
 
     try:
         xx, yy = circle_intersection(r, rad_capricorn, x)
     except ValueError:
         # horizon is within capricorn so can paint as circles
         c = Circle((0, 0), rad_capricorn, colour=Config.draw_colour, fill=config.night_colour)
-        work.add(c)
+        yield c
         c = Circle((x, 0), r, colour=Config.draw_colour, fill=config.day_colour)
-        work.add(c)
+        yield c
         return
 
-    def paint(circle, colour, fn):
-        points = Points(fill=colour)
-        s = arc_to_poly(circle)
-        for x, y in s.points:
-            if fn(x, xx):
-                points.add((x, y)) 
-        work.add(points)
-
-    def fn(x, xx): return True
-    paint(capricorn, config.night_colour, fn)
+    # night : all of capricorn
+    yield Region([ (0, 0, rad_capricorn, 0, 360), ], config.night_colour, config.tolerance)
 
-    def fn(x, xx): return x > xx
-    paint(capricorn, config.day_colour, fn)
+    # day : the lens inside both capricorn and the horizon,
+    # made of the arc of each circle that lies inside the other
+    def inside(cx, r, other):
+        d = 1.0 if other > cx else -1.0
+        mid = 0.0 if d > 0 else 180.0
+        half = degrees(math.atan2(yy, (xx - cx) * d))
+        return ( cx, 0, r, mid - half, mid + half, )
 
-    def fn(x, xx): return x < xx
-    paint(horizon, config.day_colour, fn)
+    arcs = [ inside(0, rad_capricorn, x), inside(x, abs(r), 0), ]
+    yield Region(arcs, config.day_colour, config.tolerance)
 
 #
 #
 #
 
 def plate(config):
-
-    work = Collection()
-
+    from lasercut.laser.laser import Arc, Circle, Polygon
+    import geometry
     # equator and tropics
     rad_capricorn = config.size
     rad_equator = r_eq(rad_capricorn)
     rad_cancer = r_can(rad_equator)
 
     if config.clock:
-        fill_plate(work, config)
-
-    outer = Circ(0, rad_capricorn)
+        yield from fill_plate(config)
 
     c = Circle((0, 0), rad_capricorn, colour=config.thick_colour)
-    work.add(c)
+    yield c
     c = Circle((0, 0), rad_equator, colour=config.thick_colour)
-    work.add(c)
+    yield c
     c = Circle((0, 0), rad_cancer, colour=config.thick_colour)
-    work.add(c)
+    yield c
 
     if config.hole:
         c = Circle((0, 0), config.hole * 2, colour=config.cut_colour)
-        work.add(c)
+        yield c
 
     # quarters
     def make_lines(points):
         p = Polygon(colour=config.thick_colour)
         for point in points:
             p.add(*point)
-        work.add(p)
+        return p
 
-    make_lines([ (-rad_capricorn, 0), (rad_capricorn, 0), ])
-    make_lines([ (0, -rad_capricorn), (0, rad_capricorn), ])
+    yield make_lines([ (-rad_capricorn, 0), (rad_capricorn, 0), ])
+    yield make_lines([ (0, -rad_capricorn), (0, rad_capricorn), ])
 
-    # draw the almucantar lines
+    # draw the almucantar lines and twilight arcs
+    alts, colours = [], []
     if config.almucantar:
         for a in range(0, 90, config.almucantar):
             colour = config.thin_colour
             if (a % 10) == 0:
                 colour = config.thick_colour
-            draw_almucantar(a, config, colour, work, rad_equator, outer)
+            alts.append(a)
+            colours.append(colour)
 
-    # twilight arcs
     if config.twilight:
-        colour = config.dotted_colour
         for twilight in config.twilight:
-            draw_almucantar(twilight, config, colour, work, rad_equator, outer)
+            alts.append(twilight)
+            colours.append(config.dotted_colour)
+
+    if alts:
+        yield from draw_almucantars(alts, colours, config, rad_equator)
 
     # azimuth lines
     if config.azimuth:
-        # horizon circle
-        hr, hx = almucantar(0.0, rad_equator, config.latitude)
-        # zenith / nadir
-        yz =  rad_equator * math.tan(radians(90.0 - config.latitude) / 2.0)
-        yn = -rad_equator * math.tan(radians(90.0 + config.latitude) / 2.0)
-        # x centre for all circles
-        yc = (yz + yn) / 2.0
-        yaz = (yz - yn) / 2.0
-        for angle in range(0, 90, config.azimuth):
-            # calculate the azimuth circle x and radius
-            xa = yaz * math.tan(radians(angle))
-            ra = yaz / math.cos(radians(angle))
-
-            def arc_angle(x, y):
-                return 90.0 - degrees(math.atan2(x - yc, y - xa))
-
-            # intersection with the horizon circle
-            inter = intersect2((hx, 0), hr, (yc, xa), ra)
-            assert inter, angle
-            (x1, y1), (x2, y2) = inter
-            # calculate the arc angles
-            a1 = arc_angle(x1, y1)
-            a2 = arc_angle(x2, y2)
-
-            # intersection with the tropic of capricorn
-            inter = intersect2((0, 0), rad_capricorn, (yc, xa), ra)
-            if inter is None:
+        angles = list(range(0, 90, config.azimuth))
+        arcs = geometry.azimuth_arcs(angles, rad_equator, config.latitude, rad_capricorn)
+        for angle, yc, xa, ra, a1, a2, valid in zip(angles, *[ x.tolist() for x in arcs ]):
+            if not valid:
                 # latitude is below the tropic of capricorn
                 continue
-            (x1, y1), (x2, y2) = inter
-            # calculate the arc angle
-            a3 = arc_angle(x2, y2)
-            if a3 < a2:
-                a2 = a3
 
             colour = config.thin_colour
             if (angle % 10) == 0:
@@ -388,29 +610,26 @@ def plate(config):
 
             # add azimuth arc
             c = Arc((yc, xa), ra, a1, a2, colour=colour)
-            work.add(c)
+            yield c
             # add same reflected in the x axis
             c = Arc((yc, xa), ra, a1, a2, colour=colour)
             c.reflect_h()
-            work.add(c)
+            yield c
 
     # engrave the latitude number
     height = config.size/20.0
     lat = config.latitude + 0.5
     text = str(int(lat / 10)) + "  " + str(int(lat % 10))
-    t = Text((0, -rad_equator*1.15), text, height=height, adjust=True, colour=config.thick_colour)
+    t = Label((0, -rad_equator*1.15), text, height=height, adjust=True, colour=config.thick_colour)
     t.rotate(270)
     t.translate(0, height*0.8)
-    work.add(t)
-
-    return work
+    yield t
 
 #
 #
 
 def mater(config):
-    work = Collection(colour=config.thick_colour)
-
+    from lasercut.laser.laser import Circle
     inner = config.size
     outer = config.outer
     mid = (inner + outer) / 2
@@ -419,12 +638,12 @@ def mater(config):
     # draw / cut circles
 
     c = Circle((0, 0), outer, colour=config.cut(), fill=config.main_colour)
-    work.add(c)
+    yield c
     c = Circle((0, 0), mid, colour=config.thick_colour)
-    work.add(c)
+    yield c
 
-    p = Circle((0, 0), config.size)
-    work.add(p)
+    p = Circle((0, 0), config.size, colour=config.thick_colour)
+    yield p
 
     # draw ticks
 
@@ -439,7 +658,7 @@ def mater(config):
         tick[2][2] = 360/(24*12) # 5 mins
 
     for a, b, n, colour in tick:
-        ticks(work, (0, 0), a, b, 0, 360, n, colour=colour)
+        yield from ticks((0, 0), a, b, 0, 360, n, colour=colour)
 
     hours = [ 
         "I", "II", "III", "IV", "V", "VI", 
@@ -461,216 +680,664 @@ def mater(config):
         # degrees
         if not config.clock:
             height = config.size/35.0
-            t = Text((0, 0), "%0.1d" % label, height=height, adjust=True)
+            t = Label((0, 0), "%0.1d" % label, height=height, adjust=True, colour=config.thick_colour)
             t.rotate(-a)
             r = small - 1
             x, y = r * math.sin(rad), r * math.cos(rad)
             t.translate(x, y)
             t.rotate(-0.3)
-            work.add(t)
+            yield t
 
         # hours
         height = config.size/20.0
-        t = Text((0, 0), hours[idx % 12], height=height, adjust=True)
+        t = Label((0, 0), hours[idx % 12], height=height, adjust=True, colour=config.thick_colour)
         t.rotate(-a - 3)
         r = mid - 2
         x, y = r * math.sin(rad), r * math.cos(rad)
         t.translate(x, y)
         t.rotate(-90 - 16)
-        work.add(t)
-
-    return work
+        yield t
 
 #
 #
 
 def rear_limb(config):
-    work = Collection()
-
+    from lasercut.laser.laser import Circle
     inner = config.size
     outer = config.outer
     mid = (outer + inner) / 2.0
     small = (outer + mid) / 2.0
 
     c = Circle((0, 0), outer, colour=config.cut())
-    work.add(c)
+    yield c
 
     c = Circle((0, 0), mid, colour=config.thick_colour)
-    work.add(c)
+    yield c
 
-    ticks(work, (0, 0), inner, mid, 0, 360, 30, colour=config.thick_colour)
-    ticks(work, (0, 0), mid, small, 0, 360, 5, colour=config.thick_colour)
-    ticks(work, (0, 0), small, outer, 0, 360, 1, colour=config.thin_colour)
+    yield from ticks((0, 0), inner, mid, 0, 360, 30, colour=config.thick_colour)
+    yield from ticks((0, 0), mid, small, 0, 360, 5, colour=config.thick_colour)
+    yield from ticks((0, 0), small, outer, 0, 360, 1, colour=config.thin_colour)
 
     # degree text for zodiac
     r = ((small + mid) / 2.0) + ((small - mid) / 3.0)
     for angle in range(0, 360, 5):
         text = "%d" % (angle % 30)
-        t = Text((0, 0), text, height=config.size/35.0)
+        t = Label((0, 0), text, height=config.size/35.0)
         t.rotate(angle)
         rad = radians(360 - angle - (1.3 * len(text)))
         x, y = r * math.sin(rad), r * math.cos(rad)
         t.translate(x, y)
-        work.add(t)
+        yield t
 
     # text for zodiac
     r = (mid + inner) / 2.0
     for idx, sign in enumerate(zodiac):
         angle = 180 + (idx * 30)
-        t = Text((0, 0), sign, height=config.size/25.0)
+        t = Label((0, 0), sign, height=config.size/25.0)
         angle += 18
         t.rotate(angle)
         rad = radians(360 - angle)
         x, y = r * math.sin(rad), r * math.cos(rad)
         t.translate(x, y)
-        work.add(t)
-
-    return work 
+        yield t
 
 #
 #
 
-def rear_plate(config):
+#
+#   Rear calendar : the days of the year on an eccentric ring, each day
+#   tick on the line from the centre to the sun's longitude that day,
+#   to read against the zodiac scale on the rear limb. The ring centre
+#   is 2e (the equation of centre) towards aphelion, where the sun is
+#   slowest, so the days come out nearly evenly spaced along it.
+
+calendar_year = 2001
+
+def zodiac_dir(lon):
+    # unit vector on the rear for ecliptic longitude lon, as rear_limb()
+    import numpy as np
+    a = np.radians(180.0 + lon)
+    return -np.sin(a), np.cos(a)
+
+def ring_hit(ux, uy, cx, cy, r):
+    # distance out along unit vectors u to the circle centre cx, cy
+    import numpy as np
+    b = (ux * cx) + (uy * cy)
+    return b + np.sqrt((b * b) - (cx * cx) - (cy * cy) + (r * r))
 
-    work = Collection()
+def rear_plate(config):
+    import sun
+    import numpy as np
+    from lasercut.laser.laser import Circle
 
     c = Circle((0, 0), config.size, colour=config.thick_colour)
-    work.add(c)
-
-    if 0:
-        r = config.outer
-        angle = longitude_of_perihelion
-        x = r * math.sin(radians(angle))
-        y = - r * math.cos(radians(angle))
-        c = Polygon()
-        c.add(x, y)
-        c.add(-x, -y)
-        work.add(c)
-
-        x0, y0 = 10, 10 # TODO
-        r = config.size - math.sqrt((x0 * x0) + (y0 * y0))
-        for day in range(days):
-            c = Polygon()
-            angle = day * 360.0 / days
-            x = r * math.sin(radians(angle))
-            y = r * math.cos(radians(angle))
-            c.add(x0 + x, y0 + y)
-            c.add(0, 0)
-            work.add(c)
+    yield c
+
+    # eccentric ring, touching the plate edge at aphelion
+    e = eccentricity
+    r = config.size / (1.0 + (2.0 * e))
+    cx, cy = [ -2.0 * e * r * v for v in zodiac_dir(longitude_of_perihelion) ]
+    day_w = config.size / 20.0
+    month_w = config.size / 12.0
+    for rr in [ r, r - day_w, r - day_w - month_w ]:
+        yield Circle((cx, cy), rr, colour=config.thick_colour)
+
+    # the sun at the start of each day, and of the next year
+    lon = sun.calendar(calendar_year, days + 1, hour=0)[0]
+    lon = np.degrees(np.unwrap(np.radians(lon)))
+    day = np.arange(days + 1)
+    first = np.cumsum([ 0 ] + [ n for name, n in months ])
+    date = day - first[np.searchsorted(first, day, side='right') - 1]
+
+    def spokes(lon, r1, r2):
+        # (n, 2, 2) ends of lines towards the centre, from ring r1 in to ring r2
+        ux, uy = zodiac_dir(lon)
+        t1, t2 = ring_hit(ux, uy, cx, cy, r1), ring_hit(ux, uy, cx, cy, r2)
+        return np.stack([ np.column_stack([ ux * t1, uy * t1 ]), np.column_stack([ ux * t2, uy * t2 ]) ], axis=1)
+
+    # day ticks, longer every 5 and 10 days, month ticks across both bands
+    d = day[:days][date[:days] != 0]
+    dd = date[d] + 1
+    length = np.where((dd % 10) == 0, 0.6, np.where((dd % 5) == 0, 0.4, 0.25)) * day_w
+    ux, uy = zodiac_dir(lon[d])
+    t1 = ring_hit(ux, uy, cx, cy, r)
+    ends = np.stack([ np.column_stack([ ux * t1, uy * t1 ]), np.column_stack([ ux * (t1 - length), uy * (t1 - length) ]) ], axis=1)
+    yield TickRing.from_ends(ends, colour=config.thin_colour)
+    yield TickRing.from_ends(spokes(lon[first[:-1]], r, r - day_w - month_w), colour=config.thick_colour)
+
+    # month names, centred in each month and running clockwise as the zodiac
+    h = config.size / 25.0
+    mid = np.interp((first[:-1] + first[1:]) / 2.0, day, lon)
+    ux, uy = zodiac_dir(mid)
+    base = ring_hit(ux, uy, cx, cy, r - day_w - month_w) + ((month_w - h) / 2.0)
+    size = np.array([ len(name) for name, n in months ])
+    start = (180.0 + mid + np.degrees(0.45 * h * size / base)) % 360.0
+    for (name, n), a, rb in zip(months, start.tolist(), base.tolist()):
+        t = Label((0, 0), name, height=h)
+        t.rotate(a)
+        rad = radians(360 - a)
+        t.translate(rb * math.sin(rad), rb * math.cos(rad))
+        yield t
+
+#
+#
 
+#
+#   Command line / batch generation
+
+codes = { 
+    "dxf"   : ( 'DXF', '.dxf' ),
+    "gcode" : ( 'GCODE', '.ngc' ),
+    "scad"  : ( 'SCAD', '.scad' ),
+    "pdf"   : ( 'PDF', '.pdf' ),
+}
+
+def renderer(name):
+    # lasercut keeps all its renderers in one module : load it on first use
+    from lasercut.laser import render
+    return getattr(render, name)
+
+def get_codes(text):
+    found = []
+    for code in text.split(","):
+        try:
+            name, ext = codes[code]
+        except KeyError:
+            raise Exception("unknown code '%s'" % code)
+        found.append((code, renderer(name), ext))
+    return found
+
+def parse_range(text):
+    # eg. "50.37" or "40,45,50.5" or "30:60:5" (start:stop:step, inclusive)
+    lats = []
+    for item in text.split(","):
+        if ":" in item:
+            fields = [ float(x) for x in item.split(":") ]
+            start, stop = fields[:2]
+            step = fields[2] if len(fields) > 2 else 1.0
+            assert step > 0, item
+            n = int(math.floor(((stop - start) / step) + 1e-9))
+            lats += [ start + (i * step) for i in range(n + 1) ]
+        else:
+            lats.append(float(item))
+    return lats
+
+def make_config(args):
+    from lasercut.laser.laser import Config
+    config = Config()
+
+    config.latitude = args.lat
+    config.twilight = [ ]
+    if args.nautical:
+        config.twilight.append(Twilight.nautical)
+    if args.civil:
+        config.twilight.append(Twilight.civil)
+    if args.astronomical:
+        config.twilight.append(Twilight.astronomical)
+
+    # pitch of lines
+    config.almucantar = args.almucantar
+    config.azimuth = args.azimuth
+
+    # radius of the edge of the plate (tropic of Capricorn)
+    config.size = args.size
+    config.outer = config.size * 1.2
+    config.hole = args.hole
+    config.clock = args.clock
+    # largest error allowed when flattening arcs
+    config.tolerance = args.tolerance
+    # stars on the rete, and how their labels are placed
+    config.star_mag = getattr(args, "mag", 2.0)
+    config.labels = getattr(args, "labels", "table")
+
+    config.night_colour = (0.65, 0.65, 1)
+    config.day_colour = (0.85, 0.85, 1)
+    config.main_colour = (0.9, 0.9, 0.2)
+    return config
+
+#
+#   Config fields each part depends on, to key the part cache
+
+colour_fields = [ 'thick_colour', 'thin_colour', 'dotted_colour', 'cut_colour', 'draw_colour', ]
+
+part_fields = {
+    'plate'         : [ 'latitude', 'size', 'almucantar', 'azimuth', 'twilight', 'clock', 'hole',
+                        'night_colour', 'day_colour', 'tolerance', ],
+    'cut_plate'     : [ 'size', ],
+    'mater'         : [ 'size', 'outer', 'clock', 'main_colour', ],
+    'rear_plate'    : [ 'size', ],
+    'rear_limb'     : [ 'size', 'outer', ],
+}
+
+def make_cache(path=None):
+    if not path:
+        return None
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = [ os.path.join(here, name) for name in [ 'astrolabe.py', 'geometry.py', 'sun.py', 'cache.py' ] ]
+    from cache import PartCache
+    return PartCache(path, sources)
+
+def cached(cache, fn, config):
+    # the part as a Store, from the cache if there is one
+    def generate(config):
+        return Store(fn(config))
+    if cache is None:
+        return generate(config)
+    name = fn.__name__
+    return cache.get(name, generate, config, part_fields[name] + colour_fields)
+
+#
+#   The parts are generators of primitives, so they can be packed into
+#   a Store as they are made, or gathered into a Collection.
+
+def collect(items, colour=None):
+    from lasercut.laser.laser import Collection
+    work = Collection(colour=colour)
+    for item in items:
+        work.add(item)
     return work
 
+def stream(drawings, items):
+    for item in items:
+        for drawing in drawings:
+            item.draw(drawing, None)
+
+def measure(profiler, stage, name, **info):
+    # profiler.measure(), or nothing without --profile
+    if profiler is None:
+        import contextlib
+        return contextlib.nullcontext({})
+    return profiler.measure(stage, name, **info)
+
+# parts drawn on the same face of the same disc, so their lines can
+# coincide, eg. the circle at config.size from both mater and plate
+
+faces = {
+    'mater'         : 'front',
+    'plate'         : 'front',
+    'rear_plate'    : 'rear',
+    'rear_limb'     : 'rear',
+}
+
+def face(fn):
+    name = fn.__name__
+    return getattr(fn, "face", faces.get(name, name))
+
+def draw_parts(drawings, fns, config, cache=None, optimise=True, tol=None, profiler=None):
+    # drawings is a list of (code, drawing). Each part is packed into a
+    # Store, then drawn to every drawing, except that when optimising,
+    # gcode drawings get the whole job at the end, in toolpath order.
+    # With a dedup tolerance, coincident lines are merged across the
+    # parts on one face (never across faces : eg. the mater and the rear
+    # limb are two sides of one disc), which expands their Stores.
+    # When profiling, each part is drawn to each drawing in turn, so
+    # the time can be put down to one or the other.
+    import itertools
+    ordered = [ (code, drawing) for code, drawing in drawings if optimise and (code == 'gcode') ]
+    streamed = [ (code, drawing) for code, drawing in drawings if not (code, drawing) in ordered ]
+    merge = (tol is not None) and (tol >= 0)
+
+    def draw(targets, items, name):
+        if profiler is None:
+            stream([ drawing for code, drawing in targets ], items)
+            return
+        for code, drawing in targets:
+            with measure(profiler, "draw", name, code=code):
+                stream([ drawing ], items)
+
+    job, removed = [], {}
+    # without dedup, each part is drawn as soon as it is made
+    for key, group in itertools.groupby(fns, face if merge else id):
+        stores = []
+        for fn in group:
+            name = fn.__name__
+            print("Generating", name, file=sys.stderr)
+            with measure(profiler, "generate", name) as record:
+                store = cached(cache, fn, config)
+            if profiler:
+                profiler.count(record, store)
+            stores.append(store)
+        if merge:
+            import dedup
+            name = face(fn)
+            with measure(profiler, "dedup", name) as record:
+                items, found = dedup.dedup([ item for store in stores for item in store.items() ], tol)
+            record.update(found)
+            for kind, n in found.items():
+                removed[kind] = removed.get(kind, 0) + n
+            draw(streamed, items, name)
+        else:
+            draw(streamed, stores, name)
+            items = store.items()
+        if ordered:
+            # toolpath works on the primitives themselves
+            job += list(items)
+
+    if merge:
+        text = ", ".join([ "%d %s" % (n, kind) for kind, n in removed.items() if n ])
+        print("Removed duplicates:", text or "none", file=sys.stderr)
+
+    if ordered:
+        import toolpath
+        with measure(profiler, "optimise", "job") as record:
+            job, before, after = toolpath.optimise(job)
+        record.update({ 'travel_before' : before, 'travel_after' : after, })
+        print("Laser travel %.1f -> %.1f" % (before, after), file=sys.stderr)
+        draw(ordered, job, "job")
+
+def save(drawings, paths, profiler=None):
+    for (code, drawing), path in zip(drawings, paths):
+        print("Writing to", path, file=sys.stderr)
+        name = os.path.basename(path) if path else "stdout"
+        with measure(profiler, "save", name, code=code) as record:
+            drawing.save()
+        if profiler:
+            profiler.size(record, path)
+
+def make_profiler(args, tag=None):
+    if not (args.profile or args.cprofile):
+        return None
+    from profiler import Profiler
+    return Profiler(args.cprofile, tag)
+
+def plate_path(lat, ext):
+    return "plate_%g%s" % (lat, ext)
+
+def batch_plate(job):
+    # runs in a worker process : build one plate, write it in every code
+    args, lat = job
+    args.lat = lat
+    config = make_config(args)
+    drawings, paths = [], []
+    for code, dxf, ext in get_codes(args.code):
+        path = plate_path(lat, ext)
+        drawings.append((code, dxf.drawing(path)))
+        paths.append(path)
+    profiler = make_profiler(args, "%g" % lat)
+    draw_parts(drawings, [ plate ], config, make_cache(args.cache), not args.no_optimise, args.dedup, profiler)
+    save(drawings, paths, profiler)
+    records = []
+    if profiler:
+        records = [ dict(r, lat=lat) for r in profiler.records ]
+    return lat, paths, records
+
+def batch(args, lats):
+    # returns the profile records of all the plates
+    jobs = [ (args, lat) for lat in lats ]
+    if not jobs:
+        print("No latitudes to make plates for", file=sys.stderr)
+        return []
+    import multiprocessing
+    procs = args.jobs or os.cpu_count()
+    records = []
+    with multiprocessing.Pool(min(procs, len(jobs))) as pool:
+        for lat, paths, recs in pool.imap_unordered(batch_plate, jobs):
+            print("Plate", lat, "written to", " ".join(paths), file=sys.stderr)
+            records += recs
+    return records
+
+#
+#   Parts for several configs nested onto sheets of stock, one file
+#   per sheet. Each plate is cut out (cut_plate) and engraved (plate),
+#   one for each latitude, with one mater and rear limb for the set.
+
+nest_parts = {
+    'plate' : [ cut_plate, plate ],
+    'mater' : [ mater ],
+    'rear'  : [ rear_plate, rear_limb ],
+}
+
+def parse_sheet(text):
+    # eg. "600x400"
+    try:
+        width, height = [ float(x) for x in text.lower().split("x") ]
+    except ValueError:
+        raise Exception("bad sheet size '%s', should be eg. 600x400" % text)
+    return width, height
+
+def moved(fn, config, cache, x, y, name, face):
+    # part generator that moves fn's primitives to x, y
+    def part(_config):
+        store = cached(cache, fn, config)
+        store.translate(x, y)
+        return store
+    part.__name__ = name
+    # each nested part is its own disc
+    part.face = face
+    return part
+
+def nest_sheets(args, lats, profiler=None):
+    import copy
+    import nest
+    width, height = parse_sheet(args.sheet)
+    cache = make_cache(args.cache)
+
+    # name, config, generators, radius of each part
+    jobs = []
+    for lat in lats:
+        a = copy.copy(args)
+        a.lat = lat
+        config = make_config(a)
+        if 'plate' in args.part:
+            jobs.append(("plate_%g" % lat, config, nest_parts['plate'], config.size))
+    for part in [ 'mater', 'rear' ]:
+        if part in args.part:
+            config = make_config(args)
+            jobs.append((part, config, nest_parts[part], config.outer))
+    if not jobs:
+        raise Exception("nothing to nest : give plate, mater and/or rear")
+
+    radii = [ job[3] for job in jobs ]
+    layout = nest.pack(radii, width, height, args.gap)
+    used = nest.usage(radii, layout, width, height)
+
+    for sheet, fraction in enumerate(used):
+        on = [ (job, x, y) for job, (s, x, y) in zip(jobs, layout) if s == sheet ]
+        print("Sheet %d: %s, %.0f%% used" % (sheet, " ".join([ job[0] for job, x, y in on ]), fraction * 100), file=sys.stderr)
+        fns = []
+        for (name, config, gens, r), x, y in on:
+            fns += [ moved(fn, config, cache, x, y, "%s_%s" % (name, fn.__name__), name) for fn in gens ]
+        drawings, paths = [], []
+        for code, dxf, ext in get_codes(args.code):
+            path = "sheet_%d%s" % (sheet, ext)
+            drawings.append((code, dxf.drawing(path)))
+            paths.append(path)
+        draw_parts(drawings, fns, None, None, not args.no_optimise, args.dedup, profiler)
+        save(drawings, paths, profiler)
+
+#
+#   Where startup time goes : runs the command again under python's
+#   -X importtime and lists the slowest imports, by cumulative time.
+
+def import_times(argv, top=25):
+    import subprocess
+    cmd = [ sys.executable, "-X", "importtime", os.path.abspath(__file__) ] + argv
+    p = subprocess.run(cmd, stderr=subprocess.PIPE, text=True)
+    times = []
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:"):
+            print(line, file=sys.stderr)
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, total = int(fields[0]), int(fields[1])
+        except ValueError:
+            # the header
+            continue
+        times.append((total, own, fields[2].strip()))
+
+    print("Imports: %d modules, %.1f ms" % (len(times), sum([ t[1] for t in times ]) / 1000.0), file=sys.stderr)
+    print("%10s %10s  %s" % ("total ms", "self ms", "module"), file=sys.stderr)
+    for total, own, name in sorted(times, reverse=True)[:top]:
+        print("%10.1f %10.1f  %s" % (total / 1000.0, own / 1000.0, name), file=sys.stderr)
+    return p.returncode
+
 #
 #
 
 if __name__ == "__main__":
 
-    codes = { 
-        "dxf"   : ( DXF, '.dxf' ),
-        "gcode" : ( GCODE, '.ngc' ),
-        "scad"  : ( SCAD, '.scad' ),
-        "pdf"   : ( PDF, '.pdf' ),
-    }
     parts = [ 'plate', 'mater', 'rear', 'rete' ]
 
     p = argparse.ArgumentParser()
     p.add_argument('part', nargs='*', default=[], help=" ".join(parts))
-    p.add_argument('--code', default='dxf', help="|".join(codes.keys()))
+    p.add_argument('--code', default='dxf', help="|".join(codes.keys()) + " (comma separated for several)")
     p.add_argument('--lat', type=float, default=50.37, help="latitude")
+    p.add_argument('--lon', type=float, default=0.0, help="longitude, east positive (for --star-times)")
+    p.add_argument('--lats', help="batch of plates, eg. 40,45,50 or 30:60:5 (start:stop:step)")
+    p.add_argument('--jobs', type=int, help="worker processes for --lats (default: all cores)")
+    p.add_argument('--sheet', help="nest the parts (a plate for each of --lats) onto sheets this size, eg. 600x400")
+    p.add_argument('--gap', type=float, default=3.0, help="space between nested parts and the sheet edge")
+    p.add_argument('--sun-table', help="write sunrise, sunset and twilight times for the latitude(s) to a .csv or .npz file")
+    p.add_argument('--star-times', help="where the stars (to --mag) are at these UTC times, comma separated or @file")
+    p.add_argument('--star-out', help="file for --star-times, .csv (default stars.csv) or .npz")
     p.add_argument('--qcad', action='store_true', help="call qcad to view the output")
     p.add_argument('--stdout', action='store_true')
     p.add_argument('--almucantar', type=int, default=5, help="step in degrees of almucantar lines")
     p.add_argument('--azimuth', type=int, default=15, help="step in degrees of azimuth lines")
     p.add_argument('--size', type=int, default=155, help="diameter of tropic of capricorn")
+    p.add_argument('--tolerance', type=float, default=0.05, help="chord error (mm) allowed when flattening arcs")
     p.add_argument('--nautical', action='store_true', help="nautical twilight")
     p.add_argument('--civil', action='store_true', help="civil twilight")
     p.add_argument('--astronomical', action='store_true', help="astronomical twilight")
     p.add_argument('--hole', type=float, help="cut central hole of size n")
     p.add_argument('--clock', action='store_true')
+    p.add_argument('--cache', help="directory to cache generated parts in")
+    p.add_argument('--no-optimise', action='store_true', help="don't reorder gcode to cut laser travel")
+    p.add_argument('--dedup', type=float, help="merge coincident lines within each part, to this tolerance (eg. 0.01)")
+    p.add_argument('--epoch', type=float, help="year of the star positions on the rete (default 2000)")
+    p.add_argument('--epochs', help="several retes, eg. 900,1500:2000:100 (start:stop:step)")
+    p.add_argument('--rete', default='csg', help="csg|flat : rete as an OpenSCAD CSG tree or flat layers")
+    p.add_argument('--mag', type=float, default=2.0, help="faintest star on the rete, or for --star-times")
+    p.add_argument('--labels', default='table', help="table|auto : star labels placed by hand or to avoid each other")
+    p.add_argument('--glyphs', help="surface|outline : zodiac glyphs as heightmaps or polygons")
+    p.add_argument('--import-time', action='store_true', help="report the time taken by each import")
+    p.add_argument('--profile', help="save the time taken by each part and backend to this json file")
+    p.add_argument('--cprofile', help="directory to save a cProfile dump of each stage in")
 
     args = p.parse_args()
+
+    if args.import_time:
+        sys.exit(import_times([ arg for arg in sys.argv[1:] if arg != '--import-time' ]))
+
     print(args)
 
     for arg in args.part:
         assert arg in parts, (args, parts)
         #print >> sys.stderr, "Generating:", arg
 
-    try:
-        dxf, ext = codes[args.code]
-    except KeyError:
-        raise Exception("unknown code '%s'" % args.code)
-
-    if len(args.part) == 0:
-        path = "/dev/null"
-    elif len(args.part) == 1:
-        path = args.part[0] + ext
-    else:
-        path = "output" + ext
-
-    if args.stdout:
-        path = None
-
-    drawing = dxf.drawing(path)
-    config = Config()
-
-    config.latitude = args.lat
-    config.twilight = [ ]
-    if args.nautical:
-        config.twilight.append(Twilight.nautical)
-    if args.civil:
-        config.twilight.append(Twilight.civil)
-    if args.astronomical:
-        config.twilight.append(Twilight.astronomical)
-
-    # pitch of lines
-    config.almucantar = args.almucantar
-    config.azimuth = args.azimuth
+    outputs = get_codes(args.code)
+
+    profiler = make_profiler(args)
+
+    def report():
+        if profiler:
+            profiler.report()
+            if args.profile:
+                profiler.save(args.profile)
+
+    if args.sun_table:
+        import sunrise
+        lats = parse_range(args.lats) if args.lats else [ args.lat ]
+        sunrise.write(args.sun_table, sunrise.table(lats))
+        print("Wrote sun table for %d latitudes to %s" % (len(lats), args.sun_table), file=sys.stderr)
+
+    if args.star_times:
+        import altaz
+        import catalogue
+        cat = catalogue.load()
+        cat = cat[catalogue.select(cat, mag=args.mag)]
+        t = altaz.parse_times(args.star_times)
+        cols = altaz.table(t, args.lat, args.lon, cat, r_eq(args.size))
+        path = args.star_out or "stars.csv"
+        altaz.write(path, cols)
+        print("Wrote %d stars x %d times to %s" % (len(cat), len(t), path), file=sys.stderr)
+
+    if (args.sun_table or args.star_times) and not args.part:
+        # only the tables were asked for : --lats gives the table's
+        # latitudes, and plates are only made if plate is given too
+        report()
+        sys.exit()
 
-    # radius of the edge of the plate (tropic of Capricorn)
-    config.size = args.size
-    config.outer = config.size * 1.2
-    config.hole = args.hole
-    config.clock = args.clock
+    if args.sheet:
+        nest_sheets(args, parse_range(args.lats) if args.lats else [ args.lat ], profiler)
+        report()
+        sys.exit()
 
-    config.night_colour = (0.65, 0.65, 1)
-    config.day_colour = (0.85, 0.85, 1)
-    config.main_colour = (0.9, 0.9, 0.2)
+    if args.lats:
+        assert set(args.part) <= set([ 'plate' ]), "--lats only generates plates"
+        records = batch(args, parse_range(args.lats))
+        if profiler:
+            profiler.records = records
+        report()
+        sys.exit()
 
-    work = Collection()
+    config = make_config(args)
+    part_cache = make_cache(args.cache)
 
     if 'rete' in args.part:
         print("Generating rete", file=sys.stderr)
         import rete
-        r = rete.Rete("rete" + ext, config)
-        r.draw()
-        r.save()
+        import catalogue
+        _, _, ext = outputs[0]
+        if args.epochs:
+            epochs = parse_range(args.epochs)
+        else:
+            epochs = [ catalogue.epoch if args.epoch is None else args.epoch ]
+        backends = { 'csg' : rete.Rete, 'flat' : rete.FlatRete, }
+        try:
+            Rete = backends[args.rete]
+        except KeyError:
+            raise Exception("unknown rete backend '%s'" % args.rete)
+        # precess the whole catalogue to every epoch at once
+        cat = catalogue.load()
+        ra, dec = catalogue.precess(cat, epochs)
+        for idx, epoch in enumerate(epochs):
+            path = "rete" + ext
+            if args.epochs or (args.epoch is not None):
+                path = "rete_%g%s" % (epoch, ext)
+            print("Writing to", path, file=sys.stderr)
+            name = "rete_%g" % epoch
+            with measure(profiler, "generate", name):
+                r = Rete(path, config, positions=(cat, ra[idx], dec[idx]), glyphs=args.glyphs)
+                r.draw()
+            with measure(profiler, "save", name, code='scad') as record:
+                r.save()
+            if profiler:
+                profiler.size(record, path)
+        report()
         sys.exit()
 
-    if 'rear' in args.part:
-        print("Generating rear", file=sys.stderr)
-        p = rear_plate(config)
-        work.add(p)
-        p = rear_limb(config)
-        work.add(p)
+    drawings, paths = [], []
+    for code, dxf, ext in outputs:
+        if len(args.part) == 0:
+            path = "/dev/null"
+        elif len(args.part) == 1:
+            path = args.part[0] + ext
+        else:
+            path = "output" + ext
 
-    if 'mater' in args.part:
-        print("Generating mater", file=sys.stderr)
-        p = mater(config)
-        work.add(p)
+        if args.stdout:
+            path = None
 
-    if 'plate' in args.part:
-        print("Generating plate", file=sys.stderr)
-        p = plate(config)
-        work.add(p)
+        drawings.append((code, dxf.drawing(path)))
+        paths.append(path)
 
-    work.draw(drawing)
-    print("Writing to", path, file=sys.stderr)
-    drawing.save()
+    generators = [
+        ( 'rear', [ rear_plate, rear_limb ], ),
+        ( 'mater', [ mater ], ),
+        ( 'plate', [ plate ], ),
+    ]
+    fns = [ fn for part, fs in generators if part in args.part for fn in fs ]
+    draw_parts(drawings, fns, config, part_cache, not args.no_optimise, args.dedup, profiler)
+    save(drawings, paths, profiler)
+    report()
 
     # call qcad to view the output
     if args.qcad:
         cmd = "qcad %s" % path
         print("Call %s" % cmd, file=sys.stderr)
+        import subprocess
         subprocess.call(cmd, shell=True)
 
 # FIN
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import json
+import time
+import pickle
+import random
+import timeit
+import argparse
+import platform
+import tempfile
+import itertools
+import tracemalloc
+
+from lasercut.laser.laser import Circle, Polygon, Collection
+from lasercut.laser.laser import degrees
+
+import numpy as np
+
+import astrolabe
+import geometry
+
+#
+#   The original intersect2(), built from lasercut objects,
+#   kept here as the reference for the closed form version.
+
+def intersect2_collection(xy1, r1, xy2, r2):
+    x1, y1 = xy1
+    x2, y2 = xy2
+    dx, dy = (x2 - x1), (y2 - y1)
+    angle = math.atan2(dy, dx)
+
+    c1 = Circle((x1, y1), r1)
+    c2 = Circle((x2, y2), r2)
+    p = Collection()
+    p.add(c1)
+    p.add(c2)
+    # translate/rotate so circles lie on y==0 axis
+    p.translate(-x1, -y1)
+    p.rotate(-degrees(angle))
+
+    inter = astrolabe.intersect(c1.x, c1.radius, c2.x, c2.radius)
+    if inter is None: # no intersection
+        return None
+
+    (xi, yi), (xii, yii) = inter
+    p = Polygon()
+    p.add(xi, yi)
+    p.add(xii, yii)
+    # reverse the translate/rotate to restore the y axis component
+    p.rotate(degrees(angle))
+    p.translate(x1, y1)
+    return p.points
+
+#
+#
+
+def circles(n, seed=1):
+    r = random.Random(seed)
+    def circle():
+        return (r.uniform(-100, 100), r.uniform(-100, 100)), r.uniform(10, 150)
+    return [ circle() + circle() for i in range(n) ]
+
+def check_intersect(cases, tolerance=1e-9):
+    for xy1, r1, xy2, r2 in cases:
+        a = intersect2_collection(xy1, r1, xy2, r2)
+        b = astrolabe.intersect2(xy1, r1, xy2, r2)
+        assert (a is None) == (b is None), (xy1, r1, xy2, r2)
+        if a is None:
+            continue
+        for p, q in zip(a, b):
+            assert math.dist(p, q) < tolerance, (p, q)
+
+def bench_intersect(n, repeat):
+    cases = circles(n)
+    check_intersect(cases)
+
+    def run(fn):
+        def f():
+            for xy1, r1, xy2, r2 in cases:
+                fn(xy1, r1, xy2, r2)
+        return min(timeit.repeat(f, number=1, repeat=repeat)) / n
+
+    x1, y1, x2, y2 = [ np.array(v) for v in zip(*[ xy1 + xy2 for xy1, r1, xy2, r2 in cases ]) ]
+    r1, r2 = [ np.array(v) for v in zip(*[ (r1, r2) for xy1, r1, xy2, r2 in cases ]) ]
+    def vector():
+        geometry.intersect2((x1, y1), r1, (x2, y2), r2)
+    t = min(timeit.repeat(vector, number=1, repeat=repeat)) / n
+
+    results = [
+        ( "collection", run(intersect2_collection), ),
+        ( "closed form", run(astrolabe.intersect2), ),
+        ( "numpy", t, ),
+    ]
+    base = results[0][1]
+    for name, t in results:
+        print("%-12s %8.3f us/call %6.1fx" % (name, t * 1e6, base / t))
+    return [ { 'bench' : 'intersect', 'name' : name, 'wall' : t, } for name, t in results ]
+
+#
+#   Part generators and output backends over a grid of configs
+
+def make_config(lat, size, step, clock=True):
+    args = argparse.Namespace(
+        lat=lat, size=size, almucantar=step, azimuth=step, hole=5.5, clock=clock,
+        nautical=True, civil=True, astronomical=True, tolerance=0.05,
+        mag=2.0, labels='table',
+    )
+    return astrolabe.make_config(args)
+
+def measure(fn, repeat):
+    # best wall time of n runs, then one traced run for peak memory
+    wall = min(timeit.repeat(fn, number=1, repeat=repeat))
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, wall, peak
+
+def retained(fn):
+    # memory still in use while the result of fn is held
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+def rete_draw(config, path):
+    import rete
+    r = rete.Rete(path, config)
+    r.draw()
+    r.save()
+    return os.path.getsize(path)
+
+def bench_parts(grid, repeat, tmp):
+    generators = [
+        ( 'plate', astrolabe.plate, ),
+        ( 'fill_plate', astrolabe.fill_plate, ),
+        ( 'mater', astrolabe.mater, ),
+        ( 'rear_limb', astrolabe.rear_limb, ),
+    ]
+    results = []
+    for lat, size, step in grid:
+        config = make_config(lat, size, step)
+        for name, fn in generators:
+            count, wall, peak = measure(lambda: len(list(fn(config))), repeat)
+            results.append({ 'bench' : 'parts', 'name' : name,
+                'lat' : lat, 'size' : size, 'step' : step,
+                'wall' : wall, 'peak' : peak, 'count' : count, })
+
+        # all the parts held at once, as objects and packed in Stores
+        held = {
+            'job_list' : lambda: [ list(fn(config)) for name, fn in generators ],
+            'job_store' : lambda: [ astrolabe.Store(fn(config)) for name, fn in generators ],
+        }
+        for name, fn in held.items():
+            parts, wall, peak = measure(fn, repeat)
+            results.append({ 'bench' : 'parts', 'name' : name,
+                'lat' : lat, 'size' : size, 'step' : step,
+                'wall' : wall, 'peak' : peak, 'held' : retained(fn), 'bytes' : len(pickle.dumps(parts)), })
+
+    # the rete does not depend on latitude or steps
+    for size in sorted(set([ size for lat, size, step in grid ])):
+        config = make_config(0, size, 0)
+        path = os.path.join(tmp, "rete.scad")
+        nbytes, wall, peak = measure(lambda: rete_draw(config, path), repeat)
+        results.append({ 'bench' : 'parts', 'name' : 'rete', 'size' : size,
+            'wall' : wall, 'peak' : peak, 'bytes' : nbytes, })
+    return results
+
+def bench_backends(grid, repeat, tmp):
+    results = []
+    for lat, size, step in grid:
+        config = make_config(lat, size, step)
+        for code, dxf, ext in astrolabe.get_codes(",".join(astrolabe.codes)):
+            path = os.path.join(tmp, "output" + ext)
+            def draw():
+                drawing = dxf.drawing(path)
+                count = 0
+                for fn in [ astrolabe.rear_plate, astrolabe.rear_limb, astrolabe.mater, astrolabe.plate ]:
+                    items = list(fn(config))
+                    astrolabe.stream([ drawing ], items)
+                    count += len(items)
+                drawing.save()
+                return count
+            count, wall, peak = measure(draw, repeat)
+            results.append({ 'bench' : 'backends', 'name' : code,
+                'lat' : lat, 'size' : size, 'step' : step,
+                'wall' : wall, 'peak' : peak, 'count' : count, 'bytes' : os.path.getsize(path), })
+    return results
+
+#
+#   Reporting
+
+def key(result):
+    return tuple(result.get(k) for k in [ 'bench', 'name', 'lat', 'size', 'step' ])
+
+def report(results, old=None):
+    ref = { key(r) : r for r in (old or []) }
+    for r in results:
+        text = "%-10s %-12s" % (r['bench'], r['name'])
+        for k in [ 'lat', 'size', 'step' ]:
+            if k in r:
+                text += " %s=%-6g" % (k, r[k])
+        if r['wall'] < 1e-3:
+            text += " %10.3f us" % (r['wall'] * 1e6)
+        else:
+            text += " %10.3f ms" % (r['wall'] * 1e3)
+        if 'peak' in r:
+            text += " %8.1f kB" % (r['peak'] / 1024)
+        if 'held' in r:
+            text += " %8.1f kB held" % (r['held'] / 1024)
+        if 'count' in r:
+            text += " %6d prims" % r['count']
+        if 'bytes' in r:
+            text += " %8d bytes" % r['bytes']
+        was = ref.get(key(r))
+        if was:
+            text += " %6.2fx" % (r['wall'] / was['wall'])
+        print(text)
+
+#
+#
+
+if __name__ == "__main__":
+    benches = [ 'intersect', 'parts', 'backends', ]
+
+    p = argparse.ArgumentParser()
+    p.add_argument('bench', nargs='*', default=[ 'parts', 'backends', ], help=" ".join(benches))
+    p.add_argument('-n', type=int, default=10000, help="calls per intersect run")
+    p.add_argument('--repeat', type=int, default=5, help="take the best of n runs")
+    p.add_argument('--lats', default="30,50.37,65", help="latitudes, eg. 30:60:5 (not 0 : the plate has no equator case)")
+    p.add_argument('--sizes', default="100,155", help="plate sizes")
+    p.add_argument('--steps', default="1,5,15", help="almucantar / azimuth steps")
+    p.add_argument('--json', help="save the results to this file")
+    p.add_argument('--compare', help="show the change against a saved --json file")
+    args = p.parse_args()
+
+    for bench in args.bench:
+        assert bench in benches, (bench, benches)
+
+    grid = list(itertools.product(
+        astrolabe.parse_range(args.lats),
+        astrolabe.parse_range(args.sizes),
+        [ int(x) for x in astrolabe.parse_range(args.steps) ],
+    ))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if 'intersect' in args.bench:
+            results += bench_intersect(args.n, args.repeat)
+        if 'parts' in args.bench:
+            results += bench_parts(grid, args.repeat, tmp)
+        if 'backends' in args.bench:
+            results += bench_backends(grid, args.repeat, tmp)
+
+    old = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+    report(results, old)
+
+    if args.json:
+        info = {
+            'time' : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python' : platform.python_version(),
+            'machine' : platform.machine(),
+            'args' : vars(args),
+            'results' : results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(info, f, indent=1)
+
+# FIN
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+#
+#   Build driver for the 3D parts : renders the rete and every part
+#   in ../scad to STL with the OpenSCAD command line, in parallel.
+#
+#   Each STL is cached under a hash of the SCAD source, every file it
+#   includes, uses or imports (followed recursively), the OpenSCAD
+#   version and the command line, so unchanged parts are not rendered
+#   again. Files that other parts include (eg. nuts.scad) are libraries,
+#   not parts. A part that fails is reported without stopping the others.
+
+here = os.path.dirname(os.path.abspath(__file__))
+scad_dir = os.path.join(os.path.dirname(here), "scad")
+
+version = 1
+
+# how astrolabe.sh makes the rete
+rete_args = [ "--size", "155", "--code", "scad", "--hole", "5.5", "rete", ]
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "astrolabe", "stl", "v%d" % version)
+
+def library_path():
+    # where OpenSCAD looks for include <...> after the file's own directory
+    paths = [ p for p in os.environ.get("OPENSCADPATH", "").split(os.pathsep) if p ]
+    paths.append(os.path.join(os.path.expanduser("~"), ".local", "share", "OpenSCAD", "libraries"))
+    return paths
+
+#
+#   Dependencies
+
+depends_re = re.compile(r'(?:include|use)\s*<([^>]+)>|(?:surface|import)\s*\(\s*(?:file\s*=\s*)?"([^"]+)"')
+comment_re = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+
+def find(name, base):
+    for d in [ base ] + library_path():
+        path = os.path.join(d, name)
+        if os.path.exists(path):
+            return os.path.abspath(path)
+    return None
+
+def depends(path, seen=None):
+    # the files path depends on, including itself ; missing ones are None
+    if seen is None:
+        seen = {}
+    path = os.path.abspath(path)
+    if path in seen:
+        return seen
+    seen[path] = path
+    with open(path, errors="replace") as f:
+        text = comment_re.sub("", f.read())
+    base = os.path.dirname(path)
+    for m in depends_re.finditer(text):
+        name = m.group(1) or m.group(2)
+        found = find(name, base)
+        if found is None:
+            seen[name] = None
+        elif found.endswith(".scad"):
+            depends(found, seen)
+        else:
+            seen[found] = found
+    return seen
+
+def part_key(path, openscad, extra=[]):
+    h = hashlib.sha256()
+    h.update(repr((version, openscad, extra)).encode())
+    deps = depends(path)
+    for name in sorted(deps.keys()):
+        h.update(name.encode())
+        if deps[name] is None:
+            h.update(b"missing")
+            continue
+        with open(deps[name], "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    missing = sorted([ name for name, found in deps.items() if found is None ])
+    return h.hexdigest(), missing
+
+def openscad_version(openscad):
+    try:
+        p = subprocess.run([ openscad, "--version" ], capture_output=True, text=True)
+    except FileNotFoundError:
+        raise Exception("can't run '%s'" % openscad)
+    return (p.stdout + p.stderr).strip()
+
+#
+#   Rendering
+
+def render(job):
+    # runs in a worker process : returns name, stl path, state, seconds, message
+    path, out, cache, openscad, extra, key = job
+    name = os.path.splitext(os.path.basename(path))[0]
+    stl = os.path.join(out, name + ".stl")
+    cached = os.path.join(cache, key + ".stl")
+    if os.path.exists(cached):
+        shutil.copyfile(cached, stl)
+        return name, stl, "cached", 0.0, ""
+
+    # write then rename, so a failed or parallel render never leaves a partial file
+    fd, tmp = tempfile.mkstemp(dir=cache, suffix=".stl")
+    os.close(fd)
+    t0 = time.time()
+    cmd = [ openscad, "-o", tmp ] + extra + [ path ]
+    p = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(path))
+    dt = time.time() - t0
+    if (p.returncode != 0) or not os.path.getsize(tmp):
+        os.unlink(tmp)
+        lines = [ line for line in p.stderr.splitlines() if line.strip() ]
+        return name, None, "failed", dt, lines[-1] if lines else ""
+    os.replace(tmp, cached)
+    shutil.copyfile(cached, stl)
+    return name, stl, "rendered", dt, ""
+
+def make_rete(python=sys.executable):
+    # writes rete.scad, as astrolabe.sh does
+    print("Generating rete.scad", file=sys.stderr)
+    subprocess.run([ python, os.path.join(here, "astrolabe.py") ] + rete_args, cwd=here, check=True)
+    return os.path.join(here, "rete.scad")
+
+def build(paths, out, cache, openscad, extra=[], jobs=None, force=False):
+    os.makedirs(out, exist_ok=True)
+    os.makedirs(cache, exist_ok=True)
+    ident = openscad_version(openscad)
+
+    todo = []
+    for path in paths:
+        key, missing = part_key(path, ident, extra)
+        for name in missing:
+            print("Warning: %s needs %s, which wasn't found" % (os.path.basename(path), name), file=sys.stderr)
+        if force:
+            cached = os.path.join(cache, key + ".stl")
+            if os.path.exists(cached):
+                os.unlink(cached)
+        todo.append((path, out, cache, openscad, extra, key))
+
+    failed = []
+    procs = min(jobs or os.cpu_count(), len(todo)) or 1
+    with multiprocessing.Pool(procs) as pool:
+        for name, stl, state, dt, msg in pool.imap_unordered(render, todo):
+            print("%-20s %-8s %8.1fs %s" % (name, state, dt, stl or msg), file=sys.stderr)
+            if state == "failed":
+                failed.append(name)
+    return failed
+
+#
+#
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument('part', nargs='*', default=[], help="rete and/or .scad files (default: rete and all of ../scad)")
+    p.add_argument('--out', default="stl", help="directory to write the STL files to")
+    p.add_argument('--cache', default=cache_dir(), help="directory to cache the STL files in")
+    p.add_argument('--openscad', default=os.environ.get("OPENSCAD", "openscad"), help="OpenSCAD command")
+    p.add_argument('--jobs', type=int, help="OpenSCAD processes at once (default: all cores)")
+    p.add_argument('--force', action='store_true', help="render even if cached")
+    p.add_argument('--no-rete', action='store_true', help="use the existing rete.scad")
+    args = p.parse_args()
+
+    if args.part:
+        parts = args.part
+    else:
+        files = sorted([ os.path.join(scad_dir, name) for name in os.listdir(scad_dir) if name.endswith(".scad") ])
+        libs = set()
+        for path in files:
+            libs.update([ name for name in depends(path) if name != path ])
+        parts = [ 'rete' ] + [ path for path in files if not path in libs ]
+
+    # the motor assembly uses rete.scad, so make it before working out the hashes
+    rete = os.path.join(here, "rete.scad")
+    wants_rete = ('rete' in parts) or any([ os.path.basename(name) == "rete.scad" for path in parts if path != 'rete' for name in depends(path) ])
+    if wants_rete and not args.no_rete:
+        make_rete()
+
+    paths = [ rete if path == 'rete' else os.path.abspath(path) for path in parts ]
+    failed = build(paths, os.path.abspath(args.out), args.cache, args.openscad, jobs=args.jobs, force=args.force)
+    if failed:
+        print("Failed:", " ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+# FIN
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+
+#
+#   Content addressed cache of generated parts.
+#
+#   Each part is stored under a hash of its name, the config fields it
+#   depends on and the source of the modules that generate it, so an
+#   edit to the code invalidates the old entries. Entries are held as
+#   pickles, in memory and optionally on disk, so every get() returns
+#   a fresh copy that the caller is free to modify.
+
+version = 1
+
+def source_hash(paths):
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class PartCache:
+
+    def __init__(self, path=None, sources=None):
+        if sources is None:
+            sources = []
+        self.path = path
+        self.source = source_hash(sources)
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def key(self, name, values):
+        text = json.dumps([ version, self.source, name, values ], sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + ".pickle")
+
+    def load(self, key):
+        data = self.memory.get(key)
+        if (data is None) and self.path:
+            try:
+                with open(self.filename(key), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            self.memory[key] = data
+        return data
+
+    def save(self, key, data):
+        self.memory[key] = data
+        if not self.path:
+            return
+        # write then rename, so parallel workers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.filename(key))
+
+    def get(self, name, fn, config, fields):
+        values = { field : getattr(config, field, None) for field in fields }
+        key = self.key(name, values)
+        data = self.load(key)
+        if data is None:
+            self.misses += 1
+            data = pickle.dumps(fn(config), pickle.HIGHEST_PROTOCOL)
+            self.save(key, data)
+        else:
+            self.hits += 1
+            print("Cached", name, key[:12], file=sys.stderr)
+        return pickle.loads(data)
+
+# FIN
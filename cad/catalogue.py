@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+import argparse
+
+import numpy as np
+
+#
+#   Star catalogue snapshot for the rete.
+#
+#   A one-off build step runs pyephem over its star list and writes
+#   name, J2000 RA, Dec, proper motion (radians, radians / year) and
+#   magnitude to a numpy .npy file. The rete memory maps the file,
+#   so ephem is only needed to build it.
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stars.npy")
+
+# epoch of the catalogue positions (J2000)
+epoch = 2000.0
+
+dtype = np.dtype([
+    ( 'name', 'S16', ),
+    ( 'ra', 'f8', ),
+    ( 'dec', 'f8', ),
+    ( 'pmra', 'f8', ), # on the sky, ie. includes cos(dec)
+    ( 'pmdec', 'f8', ),
+    ( 'mag', 'f4', ),
+])
+
+mas = math.radians(1.0 / 3600000.0)
+
+def build(path=default_path):
+    import ephem # pyephem
+    import ephem.stars as stars
+
+    names = list(stars.stars.keys())
+    cat = np.zeros(len(names), dtype=dtype)
+    for idx, name in enumerate(names):
+        star = stars.star(name)
+        star.compute()
+        cat[idx] = (
+            name.encode(),
+            float(star._ra), float(star._dec),
+            star._pmra * mas, star._pmdec * mas,
+            star.mag,
+        )
+
+    print("Writing", len(cat), "stars to", path, file=sys.stderr)
+    np.save(path, cat)
+    return cat
+
+def load(path=default_path):
+    if os.path.exists(path):
+        cat = np.load(path, mmap_mode='r')
+        if cat.dtype == dtype:
+            return cat
+        print("Rebuilding old format", path, file=sys.stderr)
+    build(path)
+    return np.load(path, mmap_mode='r')
+
+def names(cat):
+    return [ name.decode() for name in cat['name'] ]
+
+def select(cat, mag=None, skip=[]):
+    # mask of the stars at least as bright as mag, not in the skip list
+    keep = np.ones(len(cat), dtype=bool)
+    if mag is not None:
+        keep &= cat['mag'] <= mag
+    if skip:
+        keep &= ~np.isin(cat['name'], [ name.encode() for name in skip ])
+    return keep
+
+#
+#   Positions of every star for every epoch (years AD) in one pass.
+#
+#   Applies proper motion, then precession from J2000 using the
+#   IAU 1976 angles (Meeus, "Astronomical Algorithms", ch. 21).
+#   Returns ra, dec arrays shaped (epochs, stars).
+
+def precess(cat, epochs):
+    years = np.atleast_1d(np.asarray(epochs, dtype=float))[:, np.newaxis]
+
+    # proper motion, linear on the sky
+    t = years - epoch
+    dec0 = cat['dec'] + (cat['pmdec'] * t)
+    ra0 = cat['ra'] + (cat['pmra'] * t / np.cos(cat['dec']))
+
+    arcsec = math.radians(1.0 / 3600.0)
+    T = t / 100.0
+    zeta = ((2306.2181 * T) + (0.30188 * T**2) + (0.017998 * T**3)) * arcsec
+    z = ((2306.2181 * T) + (1.09468 * T**2) + (0.018203 * T**3)) * arcsec
+    theta = ((2004.3109 * T) - (0.42665 * T**2) - (0.041833 * T**3)) * arcsec
+
+    a = np.cos(dec0) * np.sin(ra0 + zeta)
+    b = (np.cos(theta) * np.cos(dec0) * np.cos(ra0 + zeta)) - (np.sin(theta) * np.sin(dec0))
+    c = (np.sin(theta) * np.cos(dec0) * np.cos(ra0 + zeta)) + (np.cos(theta) * np.sin(dec0))
+
+    ra = (np.arctan2(a, b) + z) % (2 * math.pi)
+    dec = np.arcsin(np.clip(c, -1.0, 1.0))
+    return ra, dec
+
+#
+#
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument('--epoch', type=float, default=epoch, help="year to --list positions for")
+    p.add_argument('--out', default=default_path, help="file to write")
+    p.add_argument('--list', action='store_true', help="print the catalogue")
+    args = p.parse_args()
+
+    if args.list:
+        cat = load(args.out)
+        ra, dec = precess(cat, [ args.epoch ])
+        for name, r, d, mag in zip(names(cat), ra[0], dec[0], cat['mag']):
+            print("%-16s %10.6f %10.6f %5.2f" % (name, r, d, mag))
+    else:
+        build(args.out)
+
+# FIN
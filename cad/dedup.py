@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+import copy
+import math
+
+import numpy as np
+
+#
+#   Removes coincident geometry from the parts on one face, so the laser
+#   doesn't cut or engrave the same line twice, eg. the circle at
+#   config.size which the mater and the plate both draw.
+#
+#   Only primitives of the same colour are merged, as the colour picks
+#   the laser operation. Circles and arcs on the same circle (within the
+#   tolerance) are merged into as few arcs as cover them, or one circle.
+#   Straight segments on the same line are merged where they overlap;
+#   the ticks of a TickRing are dropped if another line covers them.
+#   Filled shapes, text and longer polylines are left alone.
+
+def colour_key(item):
+    colour = getattr(item, "colour", None)
+    if colour is None:
+        return None
+    return tuple(colour) if isinstance(colour, (list, tuple)) else colour
+
+def is_round(item):
+    return (getattr(item, "radius", None) is not None) and not getattr(item, "fill", None)
+
+def is_segment(item):
+    points = getattr(item, "points", None)
+    if callable(points) or getattr(item, "fill", None) or (getattr(item, "radius", None) is not None):
+        return False
+    return isinstance(points, list) and (len(points) == 2)
+
+def groups(keys, tol):
+    # index of the first row within tol of each row, in every column
+    keys = np.asarray(keys, dtype=float).reshape(len(keys), -1)
+    near = np.all(np.abs(keys[:, None, :] - keys[None, :, :]) <= tol, axis=2)
+    return np.argmax(near, axis=1)
+
+#
+#   Circles and arcs
+
+def span(item):
+    # start angle and sweep in degrees, anticlockwise
+    a1 = getattr(item, "start_angle", None)
+    if a1 is None:
+        return 0.0, 360.0
+    a2 = item.end_angle
+    sweep = (a2 - a1) % 360.0
+    if sweep == 0.0:
+        sweep = 360.0
+    return a1 % 360.0, sweep
+
+def merge_spans(spans, tol):
+    # union of arcs round a circle, as (start, end) with end > start
+    spans = sorted([ (s, s + sweep) for s, sweep in spans ])
+    out = []
+    for s, e in spans:
+        if out and (s <= (out[-1][1] + tol)):
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([ s, e ])
+    # join across 0 degrees
+    if (len(out) > 1) and (out[-1][1] >= (out[0][0] + 360.0 - tol)):
+        s, e = out.pop()
+        out[0] = [ s, max(e, out[0][1] + 360.0) ]
+    if any([ (e - s) >= (360.0 - tol) for s, e in out ]):
+        return None
+    return out
+
+def same_span(a, b, tol):
+    start = abs(((a[0] - b[0]) + 180.0) % 360.0 - 180.0)
+    return (start <= tol) and (abs(a[1] - b[1]) <= tol)
+
+def dedup_round(items, tol):
+    # returns { index : replacement or None }
+    keys = [ (item.x, item.y, item.radius) for item in items ]
+    first = groups(keys, tol)
+    changes = {}
+    for g in np.unique(first).tolist():
+        idx = np.flatnonzero(first == g).tolist()
+        if len(idx) == 1:
+            continue
+        members = [ items[i] for i in idx ]
+        # angular tolerance from the distance tolerance
+        atol = math.degrees(tol / max(items[g].radius, tol))
+        merged = merge_spans([ span(item) for item in members ], atol)
+        for i in idx:
+            changes[i] = None
+        if merged is None:
+            # full circle : keep a circle if there is one
+            circles = [ i for i in idx if getattr(items[i], "start_angle", None) is None ]
+            if circles:
+                changes[circles[0]] = items[circles[0]]
+                continue
+            merged = [ [ 0.0, 360.0 ] ]
+        arcs = [ i for i in idx if getattr(items[i], "start_angle", None) is not None ]
+        new = []
+        for s, e in merged:
+            # reuse an arc that already covers the span
+            same = [ i for i in arcs if same_span(span(items[i]), (s % 360.0, e - s), atol) ]
+            if same:
+                changes[same[0]] = items[same[0]]
+            else:
+                new.append((s, e))
+        # and put the merged arcs in place of ones that were dropped
+        free = [ i for i in idx if changes[i] is None ]
+        for (s, e), i in zip(new, free):
+            arc = copy.copy(items[arcs[0]])
+            arc.start_angle, arc.end_angle = s % 360.0, (s % 360.0) + (e - s)
+            changes[i] = arc
+    return changes
+
+#
+#   Straight segments
+
+def dedup_lines(segments, tol):
+    # segments is a list of (p0, p1, owner) ; returns the indices to drop
+    # and the new end points of segments that absorbed others.
+    p0 = np.array([ s[0] for s in segments ], dtype=float)
+    p1 = np.array([ s[1] for s in segments ], dtype=float)
+    d = p1 - p0
+    length = np.hypot(*d.T)
+    u = np.where(length[:, None] > 0, d / np.maximum(length, 1e-12)[:, None], [ 1.0, 0.0 ])
+
+    # distance of each end of j from the line through i
+    def dist(p):
+        v = p[None, :, :] - p0[:, None, :]
+        return np.abs((u[:, None, 0] * v[:, :, 1]) - (u[:, None, 1] * v[:, :, 0]))
+    same = (dist(p0) <= tol) & (dist(p1) <= tol)
+    same &= same.T
+
+    drop, moved = set(), {}
+    done = np.zeros(len(segments), dtype=bool)
+    for i in np.argsort(-length).tolist():
+        if done[i]:
+            continue
+        line = np.flatnonzero(same[i] & ~done)
+        # longest first, positions along the line through i
+        line = line[np.argsort(-length[line])].tolist()
+        t = lambda p: float(np.dot(p - p0[i], u[i]))
+        kept = []
+        for j in line:
+            a, b = sorted([ t(p0[j]), t(p1[j]) ])
+            for k in kept:
+                lo, hi = k[1], k[2]
+                if (a >= (lo - tol)) and (b <= (hi + tol)):
+                    drop.add(j)
+                    break
+                if (segments[k[0]][2] == "line") and (segments[j][2] == "line") and (a <= (hi + tol)) and (b >= (lo - tol)):
+                    # overlapping plain segments : extend the kept one
+                    k[1], k[2] = min(lo, a), max(hi, b)
+                    moved[k[0]] = (p0[i] + (k[1] * u[i]), p0[i] + (k[2] * u[i]))
+                    drop.add(j)
+                    break
+            else:
+                kept.append([ j, a, b ])
+        done[line] = True
+    return drop, moved
+
+#
+#
+
+def dedup(items, tol=0.01):
+    # returns the items without duplicates, and counts of what was removed
+    removed = { "circle" : 0, "arc" : 0, "segment" : 0, "tick" : 0, "merged" : 0, }
+    if tol < 0:
+        return items, removed
+
+    out = list(items)
+    colours = {}
+    for n, item in enumerate(out):
+        colours.setdefault(colour_key(item), []).append(n)
+
+    for colour, idx in colours.items():
+        rounds = [ n for n in idx if is_round(out[n]) ]
+        if len(rounds) > 1:
+            changes = dedup_round([ out[n] for n in rounds ], tol)
+            for i, new in changes.items():
+                n = rounds[i]
+                if new is not out[n]:
+                    kind = "circle" if getattr(out[n], "start_angle", None) is None else "arc"
+                    removed[kind] += 1
+                    if new is not None:
+                        # a new arc, merged from overlapping ones
+                        removed["merged"] += 1
+                out[n] = new
+
+        segments = []
+        for n in idx:
+            item = out[n]
+            if item is None:
+                continue
+            if is_segment(item):
+                segments.append((item.points[0], item.points[1], "line", n, None))
+            elif getattr(item, "ends", None) is not None:
+                for k, (a, b) in enumerate(item.ends.tolist()):
+                    segments.append((a, b, "tick", n, k))
+        if len(segments) < 2:
+            continue
+        drop, moved = dedup_lines([ s[:3] for s in segments ], tol)
+        ticks = {}
+        for j in drop:
+            _, _, kind, n, k = segments[j]
+            removed["segment" if kind == "line" else "tick"] += 1
+            if kind == "line":
+                out[n] = None
+            else:
+                ticks.setdefault(n, []).append(k)
+        for j, (a, b) in moved.items():
+            n = segments[j][3]
+            out[n].points = [ tuple(a.tolist()), tuple(b.tolist()) ]
+        for n, ks in ticks.items():
+            keep = np.ones(len(out[n].ends), dtype=bool)
+            keep[ks] = False
+            out[n].ends = out[n].ends[keep]
+            if not keep.any():
+                out[n] = None
+
+    return [ item for item in out if item is not None ], removed
+
+# FIN
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+#
+#   Array versions of the plate geometry in astrolabe.py
+#
+#   Every function takes scalars or numpy arrays and works on all
+#   the elements in one pass. Where a pair of circles do not intersect
+#   the results are nan, with a boolean mask to say which are valid.
+
+import numpy as np
+
+#
+#   Equations from "The Astrolabe" by James E Morrison.
+
+def almucantars(alt, req, lat):
+    # radius and x centre of the almucantar circles for altitudes alt
+    aa, ll = np.radians(alt), np.radians(lat)
+    d = np.sin(ll) + np.sin(aa)
+    # where alt is -lat, eg. the horizon on the equator, the almucantar
+    # is a straight line, which can't be drawn as a circle
+    line = np.abs(d) < 1e-12
+    if np.any(line):
+        alts = np.broadcast_to(alt, line.shape)[line].tolist()
+        raise Exception("almucantar %s is a straight line at latitude %g : no plate for it" % (alts, lat))
+    return req * np.cos(aa) / d, req * np.cos(ll) / d
+
+def r_dec(r_eq, dec):
+    # radius of declination
+    return r_eq * np.tan(np.radians((90.0 - np.asarray(dec)) / 2.0))
+
+#
+#   Intersection of 2 circles, centres on the y==0 axis.
+#
+#   Returns x, y, valid. The two intersections are (x, y) and (x, -y).
+
+def intersect(x0, r0, x1, r1):
+    x0, r0, x1, r1 = np.broadcast_arrays(*[ np.asarray(v, dtype=float) for v in (x0, r0, x1, r1) ])
+    # http://paulbourke.net/geometry/circlesphere/
+    dx = x1 - x0
+    d = np.abs(dx)
+
+    valid = (d <= (r0 + r1)) & (d >= np.abs(r0 - r1)) & (d != 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = ((r0*r0) - (r1*r1) + (d*d)) / (2 * d)
+        h = np.sqrt((r0*r0) - (a*a))
+        x = x0 + (dx * (a/d))
+        y = dx * (h/d)
+
+    x = np.where(valid, x, np.nan)
+    y = np.where(valid, y, np.nan)
+    return x, y, valid
+
+#
+#   Intersection of 2 circles anywhere on the plane.
+#
+#   Returns x1, y1, x2, y2, valid in the same order as intersect2()
+
+def intersect2(xy1, r1, xy2, r2):
+    x1, y1 = [ np.asarray(v, dtype=float) for v in xy1 ]
+    x2, y2 = [ np.asarray(v, dtype=float) for v in xy2 ]
+    dx, dy = (x2 - x1), (y2 - y1)
+    dc = np.hypot(dx, dy)
+
+    # solve with circle 2 rotated onto the x axis
+    x, y, valid = intersect(0.0, r1, dc, r2)
+
+    # rotate back by the angle of the line between the centres
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c, s = dx / dc, dy / dc
+    xa, ya = x1 + (x * c), y1 + (x * s)
+    return xa - (y * s), ya + (y * c), xa + (y * s), ya - (y * c), valid
+
+#
+#   Almucantar arcs clipped by the outer circle (centred on 0, 0)
+#
+#   Returns radius, x centre, start angle, end angle, clipped.
+#   Where clipped is False the almucantar lies inside the outer circle
+#   and should be drawn as a full circle.
+
+def almucantar_arcs(alt, req, lat, r_outer):
+    ra, ya = almucantars(alt, req, lat)
+    x, y, clipped = intersect(0.0, r_outer, ya, ra)
+    a = np.degrees(np.arctan2(y, x - ya))
+    b = np.degrees(np.arctan2(-y, x - ya))
+    return ra, ya, a, b, clipped
+
+#
+#   Azimuth arcs, from the horizon to the tropic of capricorn
+#
+#   Returns x centre, y centre, radius, start angle, end angle, valid.
+#   The arcs are drawn twice, the second reflected in the x axis.
+#   valid is False where the arc does not reach capricorn.
+
+def azimuth_arcs(angle, req, lat, r_cap):
+    # horizon circle
+    hr, hx = almucantars(0.0, req, lat)
+    # zenith / nadir
+    yz =  req * np.tan(np.radians(90.0 - lat) / 2.0)
+    yn = -req * np.tan(np.radians(90.0 + lat) / 2.0)
+    # x centre for all circles
+    yc = (yz + yn) / 2.0
+    yaz = (yz - yn) / 2.0
+
+    # azimuth circle y centre and radius
+    rad = np.radians(angle)
+    xa = yaz * np.tan(rad)
+    ra = yaz / np.cos(rad)
+    yc = np.full_like(xa, yc)
+
+    def arc_angle(x, y):
+        return 90.0 - np.degrees(np.arctan2(x - yc, y - xa))
+
+    # intersection with the horizon circle
+    x1, y1, x2, y2, valid = intersect2((hx, 0.0), hr, (yc, xa), ra)
+    assert np.all(valid), np.asarray(angle)[~valid]
+    a1 = arc_angle(x1, y1)
+    a2 = arc_angle(x2, y2)
+
+    # intersection with the tropic of capricorn
+    x1, y1, x2, y2, valid = intersect2((0.0, 0.0), r_cap, (yc, xa), ra)
+    a2 = np.fmin(a2, arc_angle(x2, y2))
+
+    return yc, xa, ra, a1, a2, valid
+
+#
+#   Flattening arcs into straight segments.
+#
+#   A chord of a circle radius r, spanning angle t, is r * (1 - cos(t/2))
+#   from the arc at its middle. So the number of segments for an arc
+#   follows from its radius, its sweep and the largest error allowed.
+
+def arc_steps(r, sweep, tol):
+    # segments so no chord is more than tol from the arc, sweep in degrees
+    r = np.abs(np.asarray(r, dtype=float))
+    c = np.clip(1.0 - (tol / np.maximum(r, 1e-12)), -1.0, 1.0)
+    step = np.degrees(2.0 * np.arccos(c))
+    return np.ceil(np.abs(sweep) / np.maximum(step, 1e-9)).astype(int)
+
+def scad_facets(tol, r_min, r_max):
+    # OpenSCAD $fa, $fs that keep within tol for radii r_min to r_max :
+    # it uses the fewer facets of 360 / $fa and 2 pi r / $fs
+    fa = 360.0 / arc_steps(r_max, 360.0, tol)
+    fs = 2.0 * np.pi * r_min / arc_steps(r_min, 360.0, tol)
+    return float(fa), float(fs)
+
+# FIN
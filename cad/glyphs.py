@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import hashlib
+import tempfile
+
+import numpy as np
+
+#
+#   Cache of rendered glyphs, eg. the zodiac signs on the rete.
+#
+#   Rasters are kept in memory and written once to a versioned cache
+#   directory, under a hash of the font, its size and the glyph, where
+#   OpenSCAD can load them as surface() heightmaps. A change of font file
+#   changes the hash, so a stale raster is never picked up.
+#   The rasters can also be traced into polygon outlines to extrude,
+#   which OpenSCAD renders far faster than a heightmap.
+
+version = 2
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "astrolabe", "glyphs", "v%d" % version)
+
+class Glyphs:
+
+    def __init__(self, font="Symbola_hint.ttf", size=60, stroke=2, path=None):
+        from PIL import ImageFont
+
+        self.font = ImageFont.truetype(font, size)
+        self.stroke = stroke
+        self.path = path or cache_dir()
+        self.images = {}
+
+        h = hashlib.sha256()
+        h.update(repr((font, size, stroke, self.font.getname())).encode())
+        # the file PIL opened, which may be on the system font path
+        with open(self.font.path, "rb") as f:
+            h.update(f.read())
+        self.font_id = h.hexdigest()
+
+    def key(self, glyph):
+        return hashlib.sha256((self.font_id + glyph).encode()).hexdigest()
+
+    def image(self, glyph):
+        im = self.images.get(glyph)
+        if im is None:
+            from PIL import Image, ImageDraw
+            # size it from the font metrics, not by drawing it first
+            left, top, right, bottom = self.font.getbbox(glyph, stroke_width=self.stroke)
+            im = Image.new("L", (right - left, bottom - top), (0,))
+            draw = ImageDraw.Draw(im)
+            draw.text((-left, -top), glyph, font=self.font, fill=(1,), stroke_width=self.stroke)
+            self.images[glyph] = im
+        return im
+
+    def filename(self, glyph):
+        # png of the glyph, for OpenSCAD surface()
+        path = os.path.join(self.path, self.key(glyph) + ".png")
+        if not os.path.exists(path):
+            print("creating", path, file=sys.stderr)
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".png")
+            with os.fdopen(fd, "wb") as f:
+                self.image(glyph).save(f, format="PNG")
+            os.replace(tmp, path)
+        return path
+
+    def outline(self, glyph, simplify=0.5):
+        # trace the raster into polygons, in pixels with y up, as surface() does
+        import outline as ol
+        mask = np.asarray(self.image(glyph)) > 0
+        h = mask.shape[0]
+        rects = []
+        for row, line in enumerate(mask):
+            # runs of set pixels along the row
+            edges = np.flatnonzero(np.diff(np.concatenate([ [ 0 ], line.astype(np.int8), [ 0 ] ])))
+            for x0, x1 in zip(edges[::2].tolist(), edges[1::2].tolist()):
+                rects.append(ol.rect(x0, h - row - 1, x1, h - row))
+        return ol.union(rects).simplify(simplify)
+
+# FIN
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+#
+#   Automatic placement of the star pointers and labels on the rete.
+#
+#   Each star gets a pointer from its tip, at some rotation and length,
+#   with its label (the name, or an abbreviation) along the top. The
+#   pointer and the label are each a rectangle. Stars are placed
+#   brightest first, each taking the cheapest candidate that stays
+#   inside the rete and reaches the structure (outer ring, ecliptic,
+#   bars or centre) to hang from. Its pointer must miss the other star
+#   tips, the pointers and labels already placed and the zodiac glyphs ;
+#   its label must miss all of those and the ecliptic band, whose top is
+#   cut with ticks, but may lie along the plain ring, bars and centre.
+#   Everything placed goes in grid indexes, so each test only sees its
+#   neighbours. Stars with no such candidate are left off.
+
+class Grid:
+
+    # spatial index of rectangles (4 corners each), by bounding box
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = {}
+        self.boxes = []
+        self.owners = []
+
+    def keys(self, lo, hi):
+        (x0, y0), (x1, y1) = np.floor(np.array([ lo, hi ]) / self.cell).astype(int).tolist()
+        return [ (x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) ]
+
+    def add(self, corners, owner=None):
+        idx = len(self.boxes)
+        self.boxes.append(corners)
+        self.owners.append(owner)
+        for key in self.keys(corners.min(axis=0), corners.max(axis=0)):
+            self.cells.setdefault(key, []).append(idx)
+
+    def near(self, lo, hi, owner=None):
+        # corners of the boxes that may touch the area, not those of owner
+        found = set()
+        for key in self.keys(lo, hi):
+            found.update(self.cells.get(key, []))
+        found = [ idx for idx in found if (owner is None) or (self.owners[idx] != owner) ]
+        return np.array([ self.boxes[idx] for idx in found ]).reshape(-1, 4, 2)
+
+def square(xy, size):
+    x, y = xy
+    h = size / 2.0
+    return np.array([ [ x - h, y - h ], [ x + h, y - h ], [ x + h, y + h ], [ x - h, y + h ] ])
+
+def rectangles(tip, angle, length, width):
+    # corners (n, 4, 2) of rectangles from tip along angle (radians)
+    u = np.stack([ np.cos(angle), np.sin(angle) ], axis=-1)
+    v = np.stack([ -u[:, 1], u[:, 0] ], axis=-1) * (width / 2.0)
+    tip = np.asarray(tip) + np.zeros(len(u))
+    a = np.stack([ tip.real, tip.imag ], axis=-1)
+    b = a + (u * length[:, None])
+    return np.stack([ a - v, b - v, b + v, a + v ], axis=1)
+
+def overlaps(a, b):
+    # (n, m) mask of the rectangles a that overlap rectangles b : the
+    # bounding boxes first, then separating axes for the pairs left
+    hit = np.zeros((len(a), len(b)), dtype=bool)
+    if not len(b):
+        return hit
+    alo, ahi, blo, bhi = a.min(axis=1), a.max(axis=1), b.min(axis=1), b.max(axis=1)
+    box = np.all((alo[:, None] <= bhi[None, :]) & (blo[None, :] <= ahi[:, None]), axis=2)
+    i, j = np.nonzero(box)
+    if not len(i):
+        return hit
+    pa, pb = a[i], b[j]
+    found = np.ones(len(i), dtype=bool)
+    for r in [ pa, pb ]:
+        # the edge directions of each rectangle
+        axes = np.stack([ r[:, 1] - r[:, 0], r[:, 3] - r[:, 0] ], axis=1)
+        da = np.einsum('pkc,pac->pak', pa, axes)
+        db = np.einsum('pkc,pac->pak', pb, axes)
+        found &= ~np.any((da.max(axis=2) < db.min(axis=2)) | (db.max(axis=2) < da.min(axis=2)), axis=1)
+    hit[i, j] = found
+    return hit
+
+def abbreviations(name, extra=None):
+    # labels to try for a star, longest first
+    found = [ name ]
+    if extra:
+        found.append(extra)
+    for n in [ 6, 4, 3 ]:
+        if len(name) > n:
+            found.append(name[:n])
+    return sorted(set(found), key=lambda s: (-len(s), found.index(s)))
+
+#
+#   The rete structure that pointers can hang from
+
+class Structure:
+
+    def __init__(self, radius, ring_w, cut_angle, bar_w, ecliptic, ecliptic_w, centre):
+        self.radius = radius
+        self.ring_w = ring_w
+        # the ring is open on the right, up to this angle from the x axis
+        self.open = math.radians(90 - cut_angle)
+        self.bars = [ math.radians(a) for a in [ cut_angle + 180, -cut_angle ] ]
+        self.bar_w = bar_w
+        self.ecliptic = ecliptic
+        self.ecliptic_w = ecliptic_w
+        self.centre = centre
+
+    def inside(self, x, y):
+        r = np.hypot(x, y)
+        ring = (r <= self.radius) & (r >= (self.radius - self.ring_w))
+        ring &= ~((x > 0) & (np.abs(np.arctan2(y, x)) < self.open))
+        ex, er = self.ecliptic
+        re = np.hypot(x - ex, y)
+        ecliptic = (re <= er) & (re >= (er - self.ecliptic_w))
+        found = ring | ecliptic | (r <= self.centre)
+        # the bars out to the ring, and the one up the middle
+        for a in self.bars:
+            c, s = math.cos(a), math.sin(a)
+            bx, by = (x * c) + (y * s), (y * c) - (x * s)
+            found |= (np.abs(bx) <= (self.bar_w / 2)) & (by >= 0) & (by <= self.radius)
+        found |= (x >= -self.bar_w) & (x <= 0) & (np.abs(y) <= self.radius)
+        return found
+
+    def band(self, centre, r0, r1, n=64):
+        # rectangles covering an annulus, n around
+        da = 2 * math.pi / n
+        a = np.arange(n) * da
+        inner = r0 * math.cos(da / 2)
+        start = centre + (inner * np.exp(1j * a))
+        return a, rectangles(start, a, np.full(n, r1 - inner), 2 * r1 * math.sin(da / 2))
+
+    def boxes(self):
+        # rectangles covering the ecliptic band, to keep labels off its ticks
+        ex, er = self.ecliptic
+        a, ecliptic = self.band(ex, er - self.ecliptic_w, er)
+        return ecliptic
+
+#
+#
+
+class Placer:
+
+    rotations = np.arange(0, 360, 5)
+    # pointer lengths beyond the label, as a fraction of the equator radius
+    extra = np.arange(9) * 0.1
+    char_w = 0.62 # of the text height, for the default OpenSCAD font
+    tip_size = 2.0
+
+    def __init__(self, structure, star_w, text_height, req, cell=10.0):
+        self.structure = structure
+        self.star_w = star_w
+        self.text_height = text_height
+        self.req = req
+        # star tips, labels and glyphs, pointers, and the ecliptic band
+        self.tips = Grid(cell)
+        self.labels = Grid(cell)
+        self.pointers = Grid(cell)
+        self.frame = Grid(cell)
+        for box in structure.boxes():
+            self.frame.add(box)
+
+    def block(self, xy, size, owner=None):
+        # keep labels and pointers clear of something, eg. a zodiac glyph
+        self.labels.add(square(xy, size), owner)
+
+    def tip(self, xy, owner):
+        self.tips.add(square(xy, self.tip_size), owner)
+
+    def candidates(self, name, abbrev=None):
+        rows = []
+        for rank, label in enumerate(abbreviations(name, abbrev)):
+            text = len(label) * self.char_w * self.text_height
+            for k, extra in enumerate(self.extra):
+                rows.append((rank, label, text, self.star_w + text + (extra * self.req), k))
+        rank, label, text, length, k = [ np.repeat(v, len(self.rotations)) for v in zip(*rows) ]
+        rot = np.tile(self.rotations, len(rows))
+        return rot, rank, label.tolist(), text, length, k
+
+    def clear(self, grid, boxes, ok, owner):
+        if ok.any():
+            corners = boxes[ok].reshape(-1, 2)
+            near = grid.near(corners.min(axis=0), corners.max(axis=0), owner)
+            ok[ok] &= ~overlaps(boxes[ok], near).any(axis=1)
+        return ok
+
+    def place(self, name, tip, radial, abbrev=None):
+        # returns pointer angle (radians), length and label, or None
+        rot, rank, label, text, length, k = self.candidates(name, abbrev)
+        angle = np.radians(rot) + radial
+        pointers = rectangles(tip, angle, length, self.star_w)
+
+        # inside the rete
+        ok = np.all(np.hypot(pointers[..., 0], pointers[..., 1]) <= self.structure.radius, axis=1)
+
+        # the pointer body reaches the structure
+        s = np.maximum(np.linspace(0, 1, 8)[None, :] * length[:, None], self.star_w)
+        x = tip.real + (np.cos(angle)[:, None] * s)
+        y = tip.imag + (np.sin(angle)[:, None] * s)
+        ok &= self.structure.inside(x, y).any(axis=1)
+
+        # a pointer may run by a star, but not over its tip (stars closer
+        # than the tip size share it) nor along another pointer, and
+        # mustn't cover a label ; the label must also miss the ecliptic
+        u = np.exp(1j * angle)
+        text = rectangles(tip + (self.star_w * u), angle, text, self.text_height * 1.2)
+        strip = rectangles(tip + (self.tip_size * u), angle, length - self.tip_size, self.tip_size)
+        body = rectangles(tip + (self.star_w * u), angle, length - self.star_w, self.star_w)
+        for grid, boxes in [
+                ( self.tips, strip ), ( self.pointers, body ), ( self.labels, body ),
+                ( self.tips, text ), ( self.labels, text ), ( self.pointers, text ), ( self.frame, text ), ]:
+            ok = self.clear(grid, boxes, ok, name)
+        if not ok.any():
+            return None
+
+        # full names, short pointers, pointing outwards
+        turn = np.abs(((rot + 180) % 360) - 180) / 180.0
+        cost = (rank * 10.0) + k + turn
+        best = np.flatnonzero(ok)[np.argmin(cost[ok])]
+        self.labels.add(text[best], name)
+        self.pointers.add(pointers[best], name)
+        return float(angle[best]), float(length[best]), label[best]
+
+# FIN
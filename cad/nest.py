@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import geometry
+
+#
+#   Nesting of round parts onto rectangular sheets of stock.
+#
+#   The parts are all discs (plates, maters, rear limbs), so each is
+#   packed as its bounding circle, largest first. A circle goes in the
+#   lowest, then leftmost, place where it touches two of : the sheet
+#   edges and the circles already placed, without overlapping any of
+#   them. Parts go on the first sheet they fit, else on a new sheet.
+
+def candidates(r, placed, width, height):
+    # centres where a circle radius r touches two edges or circles
+    lo_x, hi_x, lo_y, hi_y = r, width - r, r, height - r
+    xs = [ lo_x, hi_x, lo_x, hi_x, ]
+    ys = [ lo_y, lo_y, hi_y, hi_y, ]
+    if placed:
+        px, py, pr = [ np.array(v, dtype=float) for v in zip(*placed) ]
+        d = pr + r
+        # against each edge
+        for y in [ lo_y, hi_y ]:
+            dx = np.sqrt(np.maximum((d * d) - ((y - py) ** 2), 0))
+            for x in [ px - dx, px + dx ]:
+                xs += x.tolist()
+                ys += [ y ] * len(x)
+        for x in [ lo_x, hi_x ]:
+            dy = np.sqrt(np.maximum((d * d) - ((x - px) ** 2), 0))
+            for y in [ py - dy, py + dy ]:
+                xs += [ x ] * len(y)
+                ys += y.tolist()
+        # against each pair of circles
+        i, j = np.triu_indices(len(placed), 1)
+        if len(i):
+            x1, y1, x2, y2, valid = geometry.intersect2((px[i], py[i]), d[i], (px[j], py[j]), d[j])
+            for x, y in [ (x1, y1), (x2, y2) ]:
+                xs += x[valid].tolist()
+                ys += y[valid].tolist()
+    return np.array(xs), np.array(ys)
+
+def place(r, placed, width, height, eps=1e-6):
+    # the lowest, then leftmost, free centre or None
+    x, y = candidates(r, placed, width, height)
+    ok = (x >= (r - eps)) & (x <= (width - r + eps)) & (y >= (r - eps)) & (y <= (height - r + eps))
+    if placed:
+        px, py, pr = [ np.array(v, dtype=float) for v in zip(*placed) ]
+        gap = np.hypot(x[:, None] - px, y[:, None] - py) - (pr + r)
+        ok &= np.all(gap >= -eps, axis=1)
+    if not ok.any():
+        return None
+    idx = np.flatnonzero(ok)
+    best = idx[np.lexsort((x[idx], y[idx]))[0]]
+    return float(x[best]), float(y[best])
+
+def pack(radii, width, height, gap=0.0):
+    # returns sheet, x, y of the centre of each part, in the given order
+    out = [ None ] * len(radii)
+    sheets = []
+    for n in sorted(range(len(radii)), key=lambda n: -radii[n]):
+        r = radii[n] + (gap / 2.0)
+        if (2 * r) > min(width, height) - gap:
+            raise Exception("part %d, radius %g, doesn't fit the sheet" % (n, radii[n]))
+        # the sheet edge is gap / 2 in, so parts are gap from it too
+        w, h = width - gap, height - gap
+        for sheet, placed in enumerate(sheets):
+            xy = place(r, placed, w, h)
+            if xy:
+                break
+        else:
+            sheet, placed = len(sheets), []
+            sheets.append(placed)
+            xy = place(r, placed, w, h)
+        placed.append((xy[0], xy[1], r))
+        out[n] = (sheet, xy[0] + (gap / 2.0), xy[1] + (gap / 2.0))
+    return out
+
+def usage(radii, layout, width, height):
+    # fraction of each sheet covered by parts
+    sheets = max([ s for s, x, y in layout ]) + 1
+    area = np.zeros(sheets)
+    for r, (s, x, y) in zip(radii, layout):
+        area[s] += np.pi * r * r
+    return (area / (width * height)).tolist()
+
+# FIN
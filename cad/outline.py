@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+from shapely.geometry import Polygon, box
+from shapely.ops import unary_union
+from shapely import affinity
+
+import geometry
+
+#
+#   2D outlines, built with shapely, for writing finished shapes
+#   to OpenSCAD as polygons instead of CSG trees.
+
+# default chord error (mm) for discs
+tolerance = 0.05
+
+def shape(points):
+    return Polygon(points)
+
+def disc(xy, r, tol=None):
+    # polygon with enough sides that none is more than tol from the circle
+    x, y = xy
+    n = max(5, int(geometry.arc_steps(r, 360.0, tol or tolerance)))
+    a = np.linspace(0, 2 * math.pi, n, endpoint=False)
+    return Polygon(np.column_stack([ x + (r * np.cos(a)), y + (r * np.sin(a)) ]))
+
+def annulus(xy, r_outer, r_inner, tol=None):
+    return disc(xy, r_outer, tol).difference(disc(xy, r_inner, tol))
+
+def rect(x0, y0, x1, y1):
+    return box(x0, y0, x1, y1)
+
+def rotate(s, angle, origin=(0, 0)):
+    # angle in degrees, anticlockwise
+    return affinity.rotate(s, angle, origin=origin)
+
+def translate(s, x, y):
+    return affinity.translate(s, x, y)
+
+def union(shapes):
+    return unary_union(shapes)
+
+def polygons(s):
+    # the polygons in a shape, ignoring any stray lines or points
+    if s.geom_type == 'Polygon':
+        return [ s ]
+    return [ p for p in getattr(s, 'geoms', []) if p.geom_type == 'Polygon' ]
+
+def scad_polygon(s, places=4):
+    # points and paths for OpenSCAD polygon(), holes are extra paths
+    points, paths = [], []
+    for poly in polygons(s):
+        if poly.is_empty:
+            continue
+        for ring in [ poly.exterior ] + list(poly.interiors):
+            start = len(points)
+            points += [ [ round(x, places), round(y, places) ] for x, y in ring.coords[:-1] ]
+            paths.append(list(range(start, len(points))))
+    return points, paths
+
+# FIN
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+
+#
+#   Records where the time goes in a run of astrolabe.py --profile.
+#
+#   Each stage (generating a part, drawing it to one backend, saving
+#   an output ...) becomes a record with its wall and CPU time, plus
+#   whatever else is known : primitive counts by type, output bytes.
+#   With a dump directory, each stage is also run under cProfile and
+#   the stats saved there, for pstats or snakeviz.
+
+class Profiler:
+
+    def __init__(self, dump_dir=None, tag=None):
+        self.records = []
+        self.dump_dir = dump_dir
+        # to tell apart the dumps of parallel runs
+        self.tag = tag
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def measure(self, stage, name, **info):
+        record = { 'stage' : stage, 'name' : name, }
+        record.update(info)
+        prof = None
+        if self.dump_dir:
+            import cProfile
+            prof = cProfile.Profile()
+        w0, c0 = time.perf_counter(), time.process_time()
+        if prof:
+            prof.enable()
+        try:
+            yield record
+        finally:
+            if prof:
+                prof.disable()
+            record['wall'] = time.perf_counter() - w0
+            record['cpu'] = time.process_time() - c0
+            if prof:
+                parts = [ self.tag ] if self.tag else []
+                parts += [ stage, name ] + [ str(info[k]) for k in sorted(info) ]
+                path = os.path.join(self.dump_dir, "_".join(parts).replace(os.sep, "_") + ".prof")
+                prof.dump_stats(path)
+                record['cprofile'] = path
+            self.records.append(record)
+
+    def count(self, record, items):
+        # primitives by type, from a Store or a list
+        if hasattr(items, "counts"):
+            counts = items.counts()
+        else:
+            counts = {}
+            for item in items:
+                name = type(item).__name__
+                counts[name] = counts.get(name, 0) + 1
+        record['count'] = sum(counts.values())
+        record['types'] = counts
+
+    def size(self, record, path):
+        if path and os.path.exists(path):
+            record['bytes'] = os.path.getsize(path)
+
+    def report(self, f=sys.stderr):
+        for r in self.records:
+            text = "%-10s %-12s" % (r['stage'], r['name'])
+            if 'code' in r:
+                text += " %-6s" % r['code']
+            text += " %10.3f ms wall %10.3f ms cpu" % (r['wall'] * 1e3, r['cpu'] * 1e3)
+            if 'types' in r:
+                text += "  " + " ".join([ "%s=%d" % kv for kv in sorted(r['types'].items()) ])
+            if 'bytes' in r:
+                text += "  %d bytes" % r['bytes']
+            print(text, file=f)
+
+    def save(self, path):
+        info = {
+            'time' : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python' : platform.python_version(),
+            'machine' : platform.machine(),
+            'argv' : sys.argv[1:],
+            'records' : self.records,
+        }
+        with open(path, "w") as f:
+            json.dump(info, f, indent=1)
+
+# FIN
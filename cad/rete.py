@@ -1,22 +1,26 @@
 #!/usr/bin/env python3
 
 import sys
-import os
 import cmath
 import math
 
-import ephem # pyephem
-import ephem.stars as stars
+import numpy as np
 
 from lasercut.laser.render import Difference, Union, Intersection, Hull, SCAD
 from lasercut.laser.laser import radians, degrees
 
+import catalogue
+import geometry
+from glyphs import Glyphs
+
 outer_disc_w = 8
 ecliptic_w = 10
 disc_thick = 1.5
 chamfer = 3
 centre_surround = 4
 text_h = 0.5
+star_tip_h = 1
+outer_cut_angle = 26
 
 zodiac = [ 
     "Aries", "Taurus", "Gemini",
@@ -25,56 +29,57 @@ zodiac = [
     "Capricorn", "Aquarius", "Pisces",
 ]
 
-def zodiac_path(idx):
-    return os.path.join('/tmp', zodiac[idx] + '.png')    
-
-def create_zodiac():
-    zodiac_signs = [
-        "♈︎︎", "♉︎︎", "♊︎︎",
-        "♋︎︎", "♌︎︎", "♍︎︎",
-        "♎︎︎", "♏︎︎", "♐︎︎",
-        "♑︎︎", "♒︎︎", "♓︎︎",
-    ];
-    #zodiac_signs = zodiac
-
-    from PIL import ImageFont, ImageDraw, Image
-
-    font = ImageFont.truetype("Symbola_hint.ttf", 60)
-    for idx, c in enumerate(zodiac_signs):
-        path = zodiac_path(idx)
-        if os.path.exists(path):
-            continue
-        # find the size of the endered char
-        im = Image.new("L", (800, 100), (255,))
-        draw = ImageDraw.Draw(im)
-        width, height = draw.textsize(c, font=font)
-        # create an image just big enough to hold the char
-        im = Image.new("L", (width, height), (0,))
-        draw = ImageDraw.Draw(im)
-        draw.text((0, 0), c, font=font, fill=(1,), stroke_width=2)
-        print("creating", path, file=sys.stderr)
-        im.save(path)
+zodiac_signs = [
+    "♈︎︎", "♉︎︎", "♊︎︎",
+    "♋︎︎", "♌︎︎", "♍︎︎",
+    "♎︎︎", "♏︎︎", "♐︎︎",
+    "♑︎︎", "♒︎︎", "♓︎︎",
+]
 
 class Rete(SCAD):
+
+    # zodiac glyphs as 'surface' heightmaps or extruded 'outline's
+    glyph_style = 'surface'
  
-    def __init__(self, filename, config):
+    def __init__(self, filename, config, epoch=catalogue.epoch, positions=None, glyphs=None):
         super().__init__(filename)
         self.config = config
+        if glyphs:
+            self.glyph_style = glyphs
 
-        create_zodiac()
+        # catalogue, ra and dec of the stars for this epoch
+        if positions is None:
+            cat = catalogue.load()
+            ra, dec = catalogue.precess(cat, [ epoch ])
+            positions = cat, ra[0], dec[0]
+        self.positions = positions
 
-        from astrolabe import r_eq, r_can, r_dec
+        self.glyphs = Glyphs("Symbola_hint.ttf", 60)
+
+        from astrolabe import r_eq, r_can
         self.rad_capricorn = config.size/2
         self.rad_equator = r_eq(self.rad_capricorn)
         self.rad_cancer = r_can(self.rad_equator)
         print(self.rad_capricorn, self.rad_equator, self.rad_cancer, file=sys.stderr)
 
-        print("$fn = 100;", file=self.f)
-        self.r_dec = r_dec
+        # facets from the chord error, not a fixed count
+        self.tolerance = getattr(config, "tolerance", 0.05)
+        fa, fs = geometry.scad_facets(self.tolerance, 1.0, self.config.outer)
+        print("$fa = %g;" % fa, file=self.f)
+        print("$fs = %g;" % fs, file=self.f)
         self.star_w = self.rad_equator / 6
 
+    def facets(self, r):
+        # $fn for a circle of radius r
+        return { "$fn" : max(5, int(geometry.arc_steps(r, 360.0, self.tolerance))) }
+
     def circle(self, r=None):
-        self.function("circle", r=r)
+        self.function("circle", r=r, **self.facets(r))
+
+    def cylinder(self, h, r1, r2=None):
+        if r2 is None:
+            r2 = r1
+        self.function("cylinder", h=h, r1=r1, r2=r2, **self.facets(max(r1, r2)))
 
     def ticks(self, h, x, r, length, step, size, minus=0):
         #print("#", end='', file=self.f)
@@ -90,12 +95,17 @@ class Rete(SCAD):
                     self.xform("rotate", a=[ 0, 270, angle, ])
                     self.function("cube", size=[ disc_thick*3, size, r*2 ])
 
-    def ecliptic(self):
-        # Ecliptic
+    def ecliptic_circle(self):
+        # centre and radius of the ecliptic
         x0 = self.rad_capricorn
         x1 = -self.rad_cancer
         x = (x0 + x1) / 2.0
         r = (x0 - x1) / 2.0
+        return x, r
+
+    def ecliptic(self):
+        # Ecliptic
+        x, r = self.ecliptic_circle()
         with Difference(self):
             self.xform("translate", v=[ x, 0, 0, ])
             with Union(self):
@@ -110,35 +120,47 @@ class Rete(SCAD):
             self.ticks(disc_thick, x, r, chamfer*2, 30, 0.75, ecliptic_w)
             self.ticks(disc_thick, x, r, chamfer*2, 5, 0.5, chamfer)
 
+        self.zodiac(x, r)
+
+    def zodiac_place(self, x, r, idx):
+        # position of a zodiac glyph and the angle about the ecliptic centre
+        angle = 90 + (idx * 30) + 15 + 5
+        rangle = radians(angle)
+
+        rr = r - ecliptic_w + 0.5
+        # solve intersection with eliptic for angle from origin
+        a = x * math.cos(rangle)
+        c = x * math.sin(rangle)
+        b = math.sqrt((rr*rr) - (c * c))
+        z = cmath.rect(a + b, rangle)
+        zz = complex(x, 0)
+        zzz = z - zz
+        beta = cmath.phase(zzz)
+        return z, beta
+
+    def zodiac(self, x, r):
         # label ecliptic with Zodiac
         self.comment("label ecliptic with Zodiac")
         for idx in range(0, 12):
-            path = zodiac_path(idx)
             scale = 1/12
-            angle = 90 + (idx * 30) + 15 + 5
-            rangle = radians(angle)
-
-            rr = r - ecliptic_w + 0.5
-            # solve intersection with eliptic for angle from origin
-            a = x * math.cos(rangle)
-            c = x * math.sin(rangle)
-            b = math.sqrt((rr*rr) - (c * c))
-            z = cmath.rect(a + b, rangle)
+            z, beta = self.zodiac_place(x, r, idx)
             self.xform("translate", v= [ z.real, z.imag, disc_thick*2 ])
-            zz = complex(x, 0)
-            zzz = z - zz
-            beta = cmath.phase(zzz)
             self.xform("rotate", a= [ 0, 0, degrees(beta) -90 - 5 ])
-            self.xform("scale", v= [ scale*1.5, scale, text_h*3 ])
-            self.function("surface", file=f'"{path}"')
+            if self.glyph_style == 'outline':
+                import outline as ol
+                points, paths = ol.scad_polygon(self.glyphs.outline(zodiac_signs[idx]))
+                self.xform("scale", v= [ scale*1.5, scale, 1 ])
+                self.xform("linear_extrude", height=text_h)
+                self.function("polygon", points=points, paths=paths)
+            else:
+                path = self.glyphs.filename(zodiac_signs[idx])
+                self.xform("scale", v= [ scale*1.5, scale, text_h*3 ])
+                self.function("surface", file=f'"{path}"')
 
     def ecliptic_cut(self):
         self.comment("ecliptic_cut")
 
-        x0 = self.rad_capricorn
-        x1 = -self.rad_cancer
-        x = (x0 + x1) / 2.0
-        r = (x0 - x1) / 2.0
+        x, r = self.ecliptic_circle()
         self.xform("translate", v=[ x, 0, -0.01, ])
         self.cylinder(h=(disc_thick*2)+0.02, r1=r-ecliptic_w)
  
@@ -154,7 +176,7 @@ class Rete(SCAD):
                 [ w, w/2 ],
                 [ w, -w/2 ],
             ]
-            self.xform("linear_extrude", height=1)
+            self.xform("linear_extrude", height=star_tip_h)
             self.function("polygon", points=points)
 
     stars_skip = [
@@ -191,50 +213,92 @@ class Rete(SCAD):
         "Arcturus" : (0, "Arctrs", 0.42),
     }
 
-    def star(self, name, star):
-
-        if name in self.stars_skip:
-            return
+    text_height = 3.8
 
+    def star_place(self, name, r, ra):
+        # returns the star tip, pointer angle and length, label and its offset
         setting = self.star_info.get(name) or (0, name, 0.2)
 
-        #print(name, float(star.a_ra), float(star.a_dec), star.mag, file=sys.stderr)
-        r = self.r_dec(self.rad_equator, degrees(star.a_dec))
-        if r > self.rad_capricorn:
-            return
-
-        a = float(star.a_ra) + radians(90)
-        #print(name, r, a, star.mag)
-        z = cmath.rect(r, a)
-        self.xform("translate", v= [ z.real, z.imag, 0 ])
-        text_height = 3.8;
+        a = ra + radians(90)
+        tip = cmath.rect(r, a)
+        rot = setting[0] + degrees(a)
+
+        # offset from star tip to main body
+        z = cmath.rect(self.star_w, radians(rot))
+        # move the text down 1/2 a line to centre in the star pointer
+        z += cmath.rect(self.text_height/2, radians(rot) + radians(270))
+
+        return tip, rot, self.rad_equator * setting[2], setting[1] or name, z
+
+    def auto_places(self, stars):
+        # pointers and labels chosen to miss each other, see labels.py
+        import labels
+
+        x, r = self.ecliptic_circle()
+        structure = labels.Structure(self.rad_capricorn, outer_disc_w, outer_cut_angle, outer_disc_w,
+                                     (x, r), ecliptic_w, centre_surround + (self.config.hole or 0))
+        placer = labels.Placer(structure, self.star_w, self.text_height, self.rad_equator)
+
+        # the zodiac glyphs, about 7.5 x 5 from their corner
+        for idx in range(12):
+            z, beta = self.zodiac_place(x, r, idx)
+            z += cmath.rect(4.5, beta + radians(-90 - 5 + 34))
+            placer.block((z.real, z.imag), 8)
+        tips = {}
+        for name, rr, ra, mag in stars:
+            tips[name] = cmath.rect(rr, ra + radians(90))
+            placer.tip((tips[name].real, tips[name].imag), name)
+
+        placed, dropped = [], []
+        for name, rr, ra, mag in sorted(stars, key=lambda s: s[3]):
+            tip = tips[name]
+            abbrev = (self.star_info.get(name) or (0, None, 0))[1]
+            found = placer.place(name, tip, ra + radians(90), abbrev and abbrev.strip())
+            if found is None:
+                dropped.append(name)
+                continue
+            angle, length, label = found
+            rot = degrees(angle)
+            z = cmath.rect(self.star_w, angle) + cmath.rect(self.text_height/2, angle + radians(270))
+            placed.append((tip, rot, length, label, z))
+        if dropped:
+            print("No room for the labels of", ", ".join(dropped), file=sys.stderr)
+        return placed
+
+    def placements(self):
+        # (tip, rot, length, label, offset) of each star on the rete
+        stars = list(self.selected_stars())
+        labels = getattr(self.config, "labels", "table")
+        if labels == "auto":
+            return self.auto_places(stars)
+        if labels != "table":
+            raise Exception("unknown star label placement '%s'" % labels)
+        return [ self.star_place(name, r, ra) for name, r, ra, mag in stars ]
+
+    def star(self, tip, rot, length, label, z):
+        self.xform("translate", v= [ tip.real, tip.imag, 0 ])
         with Union(self):
-            rot = setting[0] + degrees(a)
-
-            # offset from star tip to main body
-            z = cmath.rect(self.star_w, radians(rot))
-            # move the text down 1/2 a line to centre in the star pointer
-            z += cmath.rect(text_height/2, radians(rot) + radians(270))
-
-            self.star_mount(name, self.rad_equator * setting[2], rot)
+            self.star_mount(label, length, rot)
 
             self.xform("translate", v= [ z.real, z.imag, (disc_thick*2) - 0.01 ])
-            self.text(text=setting[1] or name, height=text_height, rotation=rot, depth=text_h)
+            self.text(text=label, height=self.text_height, rotation=rot, depth=text_h)
+
+    def selected_stars(self):
+        cat, ra, dec = self.positions
+        # drop stars that are too dim, skipped or outside capricorn
+        # (the skip list is for the hand placed table)
+        auto = getattr(self.config, "labels", "table") == "auto"
+        keep = catalogue.select(cat, mag=getattr(self.config, "star_mag", 2.0), skip=[] if auto else self.stars_skip)
+        r = geometry.r_dec(self.rad_equator, np.degrees(dec))
+        keep &= r <= self.rad_capricorn
+        return zip(catalogue.names(cat[keep]), r[keep].tolist(), ra[keep].tolist(), cat['mag'][keep].tolist())
  
     def stars(self):
-        for name in stars.stars.keys():
-            try:
-                star = stars.star(name)
-            except KeyError:
-                raise Exception(name, stars.stars.keys())
-            star.compute()
-            if star.mag > 2.0:
-                continue # too dim
-            self.star(name, star)
+        for place in self.placements():
+            self.star(*place)
 
     def draw(self):
 
-        outer_cut_angle = 26
         a = radians(outer_cut_angle)
         radius = self.rad_capricorn
         d = radius / math.tan(a)
@@ -287,6 +351,99 @@ class Rete(SCAD):
             self.xform("linear_extrude", height=disc_thick*2 + 0.02)
             self.circle(r=self.config.hole)
 
+#
+#   Flat backend : works out the finished 2D outline of each layer of
+#   the rete in python and writes it as one linear_extrude'd polygon,
+#   so OpenSCAD has no CSG to evaluate. The ecliptic chamfer and the
+#   sloping star pointer tips become steps, one per layer.
+
+class FlatRete(Rete):
+
+    glyph_style = 'outline'
+    chamfer_steps = 3
+
+    def layers(self):
+        t = disc_thick
+        z = [ 0, star_tip_h, t ]
+        z += [ t + (t * (i + 1) / self.chamfer_steps) for i in range(self.chamfer_steps) ]
+        return list(zip(z[:-1], z[1:]))
+
+    def tick_cut(self, x, r, step, size, minus):
+        import outline as ol
+        band = ol.annulus((x, 0), r+0.01, r-minus-0.01, self.tolerance)
+        strips = [ ol.rotate(ol.rect(-r*2, 0, 0, size), angle) for angle in range(0, 360, step) ]
+        return band.intersection(ol.union(strips))
+
+    def star_pointer(self, tip, rot, length, z):
+        import outline as ol
+        w = self.star_w
+        # the hull of the tip and body slopes up to the full body width
+        t = min(max((z - star_tip_h) / ((disc_thick*2) - star_tip_h), 0), 1)
+        points = [
+            [ w * t, 0, ],
+            [ w, -w/2 ],
+            [ length, -w/2 ],
+            [ length, w/2 ],
+            [ w, w/2 ],
+        ]
+        s = ol.rotate(ol.shape(points), rot)
+        return ol.translate(s, tip.real, tip.imag)
+
+    def outline(self, z):
+        import outline as ol
+
+        # outer disc, open on the right, and the bars to the ecliptic
+        radius = self.rad_capricorn
+        d = radius / math.tan(radians(outer_cut_angle))
+        w = outer_disc_w
+        ring = ol.annulus((0, 0), radius, radius-outer_disc_w, self.tolerance)
+        ring = ring.difference(ol.shape([ [ 0, 0 ], [ radius, -d ], [ radius, d ] ]))
+        bars = [ ol.rotate(ol.rect(-w/2, 0, w/2, radius), a) for a in [ outer_cut_angle+180, -outer_cut_angle ] ]
+
+        x, r = self.ecliptic_circle()
+        shapes = [ ol.union([ ring ] + bars).difference(ol.disc((x, 0), r-ecliptic_w, self.tolerance)) ]
+
+        # connecting outer ring, centre, ecliptic
+        shapes.append(ol.rect(-w, -(radius - 0.5), 0, radius - 0.5))
+
+        # ecliptic, chamfered and cut with ticks above disc_thick
+        if z < disc_thick:
+            ecliptic = ol.annulus((x, 0), r, r-ecliptic_w, self.tolerance)
+        else:
+            outer = r - (chamfer * (z - disc_thick) / disc_thick)
+            ecliptic = ol.annulus((x, 0), outer, r-ecliptic_w, self.tolerance)
+            ecliptic = ecliptic.difference(self.ticks_cut)
+        shapes.append(ecliptic)
+
+        for tip, rot, length, label, offset in self.placed:
+            shapes.append(self.star_pointer(tip, rot, length, z))
+
+        # centre mount
+        shapes.append(ol.disc((0, 0), centre_surround + self.config.hole, self.tolerance))
+
+        return ol.union(shapes).difference(ol.disc((0, 0), self.config.hole, self.tolerance))
+
+    def draw(self):
+        import outline as ol
+
+        x, r = self.ecliptic_circle()
+        self.ticks_cut = self.tick_cut(x, r, 30, 0.75, ecliptic_w).union(self.tick_cut(x, r, 5, 0.5, chamfer))
+        self.placed = self.placements()
+
+        for z0, z1 in self.layers():
+            points, paths = ol.scad_polygon(self.outline((z0 + z1) / 2))
+            self.comment("layer %g to %g" % (z0, z1))
+            self.xform("translate", v=[ 0, 0, z0 ])
+            self.xform("linear_extrude", height=z1-z0)
+            self.function("polygon", points=points, paths=paths)
+
+        self.zodiac(x, r)
+
+        self.comment("star labels")
+        for tip, rot, length, label, offset in self.placed:
+            z = tip + offset
+            self.xform("translate", v= [ z.real, z.imag, (disc_thick*2) - 0.01 ])
+            self.text(text=label, height=self.text_height, rotation=rot, depth=text_h)
 
 if __name__ == "__main__":
     rete = Rete()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import sys
+import math
+import argparse
+
+import numpy as np
+
+# orbit constants
+from astrolabe import axial_tilt, eccentricity, longitude_of_perihelion
+
+#
+#   Sun ephemeris from the orbit constants, in array form.
+#
+#   Every function takes numpy arrays of times and works on all of
+#   them in one pass : a Keplerian orbit with the eccentricity and
+#   longitude of perihelion from astrolabe.py, slowly precessing, seen
+#   on an ecliptic tilted by the axial tilt. Good to about a minute of
+#   arc, plenty for the rear calendar and for sunrise tables.
+#
+#   Run on its own, it writes a table of the sun's longitude, declination
+#   and the equation of time for a range of dates, at any step down to
+#   a minute, as CSV or a binary .npy file.
+
+# J2000.0, the epoch of the constants
+j2000 = np.datetime64("2000-01-01T12:00:00", "s")
+
+# degrees per day : mean longitude, perihelion and tilt
+mean_motion = 0.98564736
+perihelion_rate = 1.71946 / 36525.0
+tilt_rate = -0.0130042 / 36525.0
+mean_longitude_j2000 = 280.46646
+
+dtype = np.dtype([
+    ( 'time', 'M8[s]', ),
+    ( 'longitude', 'f8', ), # degrees along the ecliptic from the equinox
+    ( 'declination', 'f8', ), # degrees
+    ( 'eot', 'f4', ), # equation of time, apparent - mean, minutes
+])
+
+steps = {
+    "day" : 86400,
+    "hour" : 3600,
+    "minute" : 60,
+}
+
+def days(t):
+    # days since J2000 of datetime64 t
+    return (np.asarray(t, dtype="M8[s]") - j2000) / np.timedelta64(86400, "s")
+
+def times(start, stop, step=86400):
+    # datetime64 from start up to (not including) stop, step in seconds
+    start, stop = np.datetime64(start, "s"), np.datetime64(stop, "s")
+    return np.arange(start, stop, np.timedelta64(int(step), "s"))
+
+def kepler(m, e, iterations=5):
+    # eccentric anomaly for mean anomaly m (radians), by Newton's method
+    E = m + (e * np.sin(m))
+    for i in range(iterations):
+        E -= (E - (e * np.sin(E)) - m) / (1.0 - (e * np.cos(E)))
+    return E
+
+def position(d, e=eccentricity, perihelion=longitude_of_perihelion, tilt=axial_tilt):
+    # longitude, declination and right ascension (degrees) and the mean
+    # longitude of the sun, d days from J2000
+    d = np.asarray(d, dtype=float)
+    mean = mean_longitude_j2000 + (mean_motion * d)
+    w = perihelion + (perihelion_rate * d)
+    E = kepler(np.radians(mean - w), e)
+    # true anomaly
+    v = 2.0 * np.arctan2(math.sqrt(1.0 + e) * np.sin(E / 2.0), math.sqrt(1.0 - e) * np.cos(E / 2.0))
+    lon = np.radians(w) + v
+    eps = np.radians(tilt + (tilt_rate * d))
+    dec = np.arcsin(np.sin(eps) * np.sin(lon))
+    ra = np.arctan2(np.cos(eps) * np.sin(lon), np.cos(lon))
+    return np.degrees(lon) % 360.0, np.degrees(dec), np.degrees(ra) % 360.0, mean % 360.0
+
+def equation_of_time(mean, ra):
+    # apparent - mean solar time, in minutes
+    return 4.0 * (((mean - ra + 180.0) % 360.0) - 180.0)
+
+def table(t, **kwargs):
+    # structured array of the sun at each datetime64 in t
+    lon, dec, ra, mean = position(days(t), **kwargs)
+    out = np.empty(len(t), dtype=dtype)
+    out['time'] = t
+    out['longitude'] = lon
+    out['declination'] = dec
+    out['eot'] = equation_of_time(mean, ra)
+    return out
+
+def calendar(year=2001, n=365, hour=12, **kwargs):
+    # sun longitude and equation of time at the hour on n days from new year
+    t = np.datetime64("%04d-01-01T%02d:00" % (year, hour), "s") + (np.arange(n) * np.timedelta64(86400, "s"))
+    lon, dec, ra, mean = position(days(t), **kwargs)
+    return lon, equation_of_time(mean, ra)
+
+#
+#   Export, a chunk of rows at a time so decades of minutes fit in memory
+
+def chunks(start, stop, step, size=1 << 20):
+    start, stop = np.datetime64(start, "s"), np.datetime64(stop, "s")
+    delta = np.timedelta64(int(step) * size, "s")
+    while start < stop:
+        end = min(start + delta, stop)
+        yield table(times(start, end, step))
+        start = end
+
+def write_csv(f, rows):
+    # one format call over the whole chunk, not one per row
+    t = np.datetime_as_string(rows['time'], unit="s")
+    cols = [ t, rows['longitude'], rows['declination'], rows['eot'].astype(float) ]
+    values = [ v for row in zip(*[ c.tolist() for c in cols ]) for v in row ]
+    f.write(("%s,%.5f,%.5f,%.3f\n" * len(rows)) % tuple(values))
+
+def write(path, start, stop, step):
+    count = 0
+    if path.endswith(".npy"):
+        # header first, then the rows straight to the file
+        n = len(times(start, stop, step))
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n,))
+        for rows in chunks(start, stop, step):
+            out[count:count+len(rows)] = rows
+            count += len(rows)
+        out.flush()
+        return count
+    with open(path, "w") as f:
+        print(",".join(dtype.names), file=f)
+        for rows in chunks(start, stop, step):
+            write_csv(f, rows)
+            count += len(rows)
+    return count
+
+#
+#
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument('--start', default="2000-01-01", help="first date, eg. 2024 or 2024-03-01T12:00")
+    p.add_argument('--stop', default="2001-01-01", help="date to stop before")
+    p.add_argument('--step', default="day", help="|".join(steps.keys()) + " or seconds")
+    p.add_argument('--out', default="sun.csv", help="file to write, .csv or .npy")
+    args = p.parse_args()
+
+    step = steps[args.step] if args.step in steps else int(args.step)
+    n = write(args.out, args.start, args.stop, step)
+    print("Wrote %d rows to %s" % (n, args.out), file=sys.stderr)
+
+# FIN
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import sun
+from astrolabe import Twilight
+
+#
+#   Sunrise, sunset and twilight tables for a grid of latitudes.
+#
+#   The sun's declination and the equation of time come from sun.py for
+#   each day of the year; the hour angle at which it crosses each altitude
+#   is then worked out for every latitude x day x event in one pass.
+#   Times are hours of local mean time, as read off the plate ; nan
+#   where the sun doesn't cross that altitude that day.
+
+# altitude of the sun's centre at sunrise : refraction and semi-diameter
+horizon = -0.833
+
+events = [
+    ( 'sun', horizon, ),
+    ( 'civil', Twilight.civil, ),
+    ( 'nautical', Twilight.nautical, ),
+    ( 'astronomical', Twilight.astronomical, ),
+]
+
+def crossings(lats, dec, eot, alts):
+    # rise and set (hours) shaped (alts, lats, days)
+    phi = np.radians(np.asarray(lats, dtype=float))[None, :, None]
+    d = np.radians(dec)[None, None, :]
+    h = np.radians(np.asarray(alts, dtype=float))[:, None, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_h = (np.sin(h) - (np.sin(phi) * np.sin(d))) / (np.cos(phi) * np.cos(d))
+        ha = np.degrees(np.arccos(np.where(np.abs(cos_h) <= 1.0, cos_h, np.nan))) / 15.0
+    noon = 12.0 - (eot / 60.0)[None, None, :]
+    return noon - ha, noon + ha
+
+def table(lats, year=2001, days=365):
+    # columns : lat, day (of the year, from 1), then rise and set of each
+    # event, flattened lat major
+    t = np.datetime64("%04d-01-01T12:00" % year, "s") + (np.arange(days) * np.timedelta64(86400, "s"))
+    lon, dec, ra, mean = sun.position(sun.days(t))
+    rise, sets = crossings(lats, dec, sun.equation_of_time(mean, ra), [ alt for name, alt in events ])
+
+    lats = np.asarray(lats, dtype=float)
+    cols = {
+        'lat' : np.repeat(lats, days).astype(np.float32),
+        'day' : np.tile(np.arange(1, days + 1, dtype=np.int16), len(lats)),
+    }
+    for idx, (name, alt) in enumerate(events):
+        cols[name + '_rise'] = rise[idx].ravel().astype(np.float32)
+        cols[name + '_set'] = sets[idx].ravel().astype(np.float32)
+    return cols
+
+def write(path, cols):
+    # .npz : one array per column, else CSV with hh:mm times
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **cols)
+        return
+    names = list(cols.keys())
+    # every minute of the day as hh:mm, then a blank for nan
+    clock = np.array([ "%02d:%02d" % divmod(m, 60) for m in range(24 * 60) ] + [ "" ])
+    columns = [ cols['lat'].tolist(), cols['day'].tolist() ]
+    for name in names[2:]:
+        v = cols[name].astype(float)
+        m = np.round(np.nan_to_num(v) * 60.0) % (24 * 60)
+        columns.append(clock[np.where(np.isnan(v), 24 * 60, m).astype(int)].tolist())
+    values = [ v for row in zip(*columns) for v in row ]
+    fmt = ",".join([ "%g", "%d" ] + ([ "%s" ] * (len(names) - 2))) + "\n"
+    with open(path, "w") as f:
+        print(",".join(names), file=f)
+        f.write((fmt * len(columns[0])) % tuple(values))
+
+# FIN
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+#
+#   Orders the primitives of a job to cut down the laser's travel
+#   between them: nearest neighbour from the origin, then 2-opt.
+#
+#   Open paths (polylines and tick rings) can be reversed, closed ones
+#   (circles) start where they end, arcs and text are fixed in direction.
+#   Primitives with no known position are left at the start of the job.
+#   The ticks in a tick ring are drawn alternately out and in.
+
+def ends(item):
+    # returns start, end, reversible or None if the position is unknown
+    points = getattr(item, "points", None)
+    if callable(points):
+        # filled Region
+        p = points()[0]
+        return (p[0], p[1]), (p[0], p[1]), False
+    if getattr(item, "ends", None) is not None:
+        # TickRing
+        return tuple(item.ends[0][0]), tuple(item.ends[-1][1]), True
+    if points and (len(points) > 1):
+        # Polygon
+        return tuple(points[0]), tuple(points[-1]), True
+    x, y = getattr(item, "x", None), getattr(item, "y", None)
+    if (x is None) or (y is None):
+        return None
+    r = getattr(item, "radius", None)
+    if r is None:
+        # Text
+        return (x, y), (x, y), False
+    a1, a2 = getattr(item, "start_angle", None), getattr(item, "end_angle", None)
+    if a1 is None:
+        # Circle
+        return (x + r, y), (x + r, y), False
+    # Arc
+    a1, a2 = math.radians(a1), math.radians(a2)
+    return (x + (r * math.cos(a1)), y + (r * math.sin(a1))), (x + (r * math.cos(a2)), y + (r * math.sin(a2))), False
+
+def reverse(item):
+    if getattr(item, "ends", None) is not None:
+        item.reverse()
+    else:
+        item.points.reverse()
+
+def travel(starts, ends, origin=(0, 0)):
+    # rapid moves from the origin, between each end and the next start
+    here = np.vstack([ [ origin ], ends[:-1] ])
+    return float(np.hypot(*(starts - here).T).sum())
+
+def inner_travel(items):
+    # rapid moves inside compound items, eg. between ticks
+    return sum([ item.travel() for item in items if hasattr(item, "travel") ])
+
+#
+#
+
+def nearest(starts, ends, flip, origin):
+    n = len(starts)
+    order, flipped = [], np.zeros(n, dtype=bool)
+    todo = np.ones(n, dtype=bool)
+    here = np.array(origin, dtype=float)
+    for i in range(n):
+        d = np.hypot(*(starts - here).T)
+        dr = np.where(flip, np.hypot(*(ends - here).T), np.inf)
+        d[~todo] = np.inf
+        dr[~todo] = np.inf
+        a, b = np.argmin(d), np.argmin(dr)
+        if dr[b] < d[a]:
+            a = b
+            flipped[a] = True
+            here = starts[a]
+        else:
+            here = ends[a]
+        order.append(a)
+        todo[a] = False
+    return np.array(order, dtype=int), flipped
+
+def two_opt(starts, ends, flip, rev, origin, passes=20):
+    # starts, ends, flip and rev are in tour order. Reversing a run of the
+    # tour reverses every item in it, so the run must all be flippable.
+    starts, ends, flip, rev = starts.copy(), ends.copy(), flip.copy(), rev.copy()
+    n = len(starts)
+    order = np.arange(n)
+    fixed = np.concatenate([ [ 0 ], np.cumsum(~flip) ])
+    home = np.array(origin, dtype=float)
+    for p in range(passes):
+        better = False
+        for i in range(n - 1):
+            prev = ends[i-1] if i else home
+            j = np.arange(i + 1, n)
+            ok = fixed[j + 1] == fixed[i]
+            if not ok.any():
+                continue
+            nxt = np.vstack([ starts[1:], [ [ np.nan, np.nan ] ] ])[j]
+            old = np.hypot(*(starts[i] - prev)) + np.nan_to_num(np.hypot(*(nxt - ends[j]).T))
+            new = np.hypot(*(ends[j] - prev).T) + np.nan_to_num(np.hypot(*(nxt - starts[i]).T))
+            gain = np.where(ok, old - new, 0)
+            k = np.argmax(gain)
+            if gain[k] > 1e-9:
+                s = slice(i, j[k] + 1)
+                starts[s], ends[s] = ends[s][::-1].copy(), starts[s][::-1].copy()
+                order[s] = order[s][::-1].copy()
+                flip[s] = flip[s][::-1].copy()
+                rev[s] = ~rev[s][::-1]
+                better = True
+        if not better:
+            break
+    return order, rev
+
+def optimise(items, origin=(0, 0)):
+    # returns the items reordered (and reversed), travel before and after
+    known = [ (item, ends(item)) for item in items ]
+    unknown = [ item for item, e in known if e is None ]
+    known = [ (item, e) for item, e in known if e is not None ]
+    if not known:
+        return items, 0.0, 0.0
+
+    starts = np.array([ e[0] for item, e in known ], dtype=float)
+    stops = np.array([ e[1] for item, e in known ], dtype=float)
+    before = travel(starts, stops, origin) + inner_travel(items)
+
+    for item, e in known:
+        if hasattr(item, "serpentine"):
+            item.serpentine()
+    known = [ (item, ends(item)) for item, e in known ]
+    starts = np.array([ e[0] for item, e in known ], dtype=float)
+    stops = np.array([ e[1] for item, e in known ], dtype=float)
+    reversible = np.array([ e[2] for item, e in known ], dtype=bool)
+    # closed paths can go either way round
+    flip = reversible | np.all(starts == stops, axis=1)
+
+    order, flipped = nearest(starts, stops, flip, origin)
+    flipped = flipped[order]
+    s = np.where(flipped[:, None], stops[order], starts[order])
+    e = np.where(flipped[:, None], starts[order], stops[order])
+    tour, rev = two_opt(s, e, flip[order], flipped, origin)
+
+    out = []
+    for idx, r in zip(order[tour], rev):
+        item = known[idx][0]
+        if r and reversible[idx]:
+            reverse(item)
+        out.append(item)
+
+    after = travel(*[ np.array([ ends(item)[k] for item in out ], dtype=float) for k in (0, 1) ], origin)
+    after += inner_travel(out)
+    return unknown + out, before, after
+
+# FIN